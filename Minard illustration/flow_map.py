@@ -0,0 +1,782 @@
+#!/usr/bin/env python3
+"""
+flow_map.py
+
+A reusable flow map renderer, generalised from plot_minard.py. Each path is drawn
+as a continuous band whose width follows a value along it (troop numbers in
+Minard's map, but equally vehicles in a fleet or people in a migration flow), and
+the same figure can be saved as a static PNG or animated with a marker moving
+along every path.
+
+Paths are columnar NumPy arrays with one row per point and the columns
+    lon, lat, value[, time]
+(see make_path()), so large datasets of 10^5-10^6 points are handled with array
+operations rather than lists of dictionaries. Nothing is drawn when the module is
+imported.
+
+HOW TO USE:
+-----------
+From Python:
+    from flow_map import load_paths, render_flow_map, animate_flow_map
+    paths = load_paths("trips.csv", path_column="trip_id")
+    fig, ax = render_flow_map(list(paths.values()), widths=0.5, output="trips.png")
+    animate_flow_map(list(paths.values()), widths=0.5, output="trips.gif")
+
+From the command line (CSV or Parquet, one row per point):
+    python flow_map.py trips.csv --path-column trip_id --output trips.png --animation trips.gif
+
+Requires matplotlib and numpy. Loading Parquet files needs pandas and pyarrow; MP4
+and WebP animations need imageio-ffmpeg.
+"""
+
+import argparse
+import csv
+import math
+import os
+import weakref
+
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+from matplotlib.collections import PolyCollection
+import numpy as np
+
+# Columns of a path array
+LON, LAT, VALUE, TIME = 0, 1, 2, 3
+
+# Simplified paths, keyed by (id(path), zoom level, widths), see simplified_indices()
+_lod_cache = {}
+
+
+def make_path(lons, lats, values, times=None):
+    """
+    Build a path array from its columns.
+    Args:
+        lons, lats (array-like): Coordinates of the points, in travel order
+        values (array-like): The quantity shown by the band's width at each point
+        times (array-like): Optional time of each point, as seconds or numpy datetime64
+    Returns:
+        numpy.ndarray: Float array of shape (points, 3), or (points, 4) with times
+    """
+    columns = [np.asarray(lons, dtype=float), np.asarray(lats, dtype=float),
+               np.asarray(values, dtype=float)]
+    if times is not None:
+        times = np.asarray(times)
+        if np.issubdtype(times.dtype, np.datetime64):
+            times = times.astype("datetime64[ms]").astype(np.int64) / 1000.0
+        columns.append(times.astype(float))
+    return np.column_stack(columns)
+
+
+def _read_columns(file_path, columns):
+    """Read the named columns of a CSV or Parquet file into NumPy arrays."""
+    is_parquet = file_path.lower().endswith((".parquet", ".pq"))
+    try:
+        import pandas as pd
+    except ImportError:
+        if is_parquet:
+            raise ImportError("Reading Parquet files needs pandas and pyarrow "
+                              "(pip install pandas pyarrow)")
+        pd = None
+
+    if pd is not None:
+        if is_parquet:
+            frame = pd.read_parquet(file_path, columns=columns)
+        else:
+            frame = pd.read_csv(file_path, usecols=columns)
+        return {name: frame[name].to_numpy() for name in columns}
+
+    # Without pandas, read the CSV file with the csv module
+    data = {name: [] for name in columns}
+    with open(file_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for name in columns:
+                data[name].append(row[name])
+    return {name: np.array(values) for name, values in data.items()}
+
+
+def _to_seconds(values):
+    """Convert a column of times (numbers, or date/time strings) to float seconds."""
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(float)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        try:
+            import pandas as pd
+            values = pd.to_datetime(values).to_numpy()
+        except ImportError:
+            values = values.astype("datetime64[ms]")
+    return values.astype("datetime64[ms]").astype(np.int64) / 1000.0
+
+
+def load_paths(file_path, path_column="path", lon_column="lon", lat_column="lat",
+               value_column="value", time_column=None):
+    """
+    Load flow paths from a CSV or Parquet file with one row per point.
+    Rows are grouped into paths by path_column. Within a path the points keep their
+    order in the file, or are sorted by time when a time column is given.
+    Args:
+        file_path (str): Path to a .csv or .parquet file
+        path_column (str): Column identifying which path each point belongs to
+        lon_column, lat_column (str): Coordinate columns
+        value_column (str): Column with the quantity shown by the band width
+        time_column (str): Optional column with the time of each point
+    Returns:
+        dict: Path identifier -> path array (see make_path())
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Flow data file not found at: {file_path}")
+
+    columns = [path_column, lon_column, lat_column, value_column]
+    if time_column:
+        columns.append(time_column)
+    data = _read_columns(file_path, columns)
+
+    ids = data[path_column]
+    times = _to_seconds(data[time_column]) if time_column else None
+    # Group the rows by path with one sort, instead of filtering once per path
+    if times is not None:
+        order = np.lexsort((times, ids))
+    else:
+        order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    starts = np.concatenate([[0], np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1])
+    stops = np.append(starts[1:], len(order))
+
+    table = make_path(data[lon_column][order], data[lat_column][order],
+                      data[value_column][order], None if times is None else times[order])
+    # NumPy scalars become plain Python values; strings from object columns have no item()
+    keys = [sorted_ids[start] for start in starts]
+    keys = [key.item() if hasattr(key, "item") else key for key in keys]
+    return {key: table[start:stop] for key, start, stop in zip(keys, starts, stops)}
+
+
+def flow_band_polygons(lons, lats, widths, mitre=False, mitre_limit=2.0):
+    """
+    Work out the corners of every trapezoid in a flow band at once.
+    Each segment between consecutive points becomes a trapezoid (rhomboid) whose
+    ends are perpendicular to the direction of travel, with the band's width at each
+    point. All the vector maths is done on whole NumPy arrays, so the cost hardly
+    depends on the number of segments.
+    Args:
+        lons, lats (array-like): Coordinates of the points along the path
+        widths (array-like): Width of the band at each point, in coordinate units
+        mitre (bool): Join consecutive segments with mitred corners, so the band is
+                      continuous around bends instead of leaving notches and overlaps
+        mitre_limit (float): Longest a mitred corner may be, as a multiple of the
+                             half-width; sharper turns keep the segments' own ends
+                             instead, so that they do not make long spikes
+    Returns:
+        numpy.ndarray: Array of shape (segments, 4, 2) with the corners of each trapezoid
+    """
+    points = np.column_stack([np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)])
+    half_widths = np.asarray(widths, dtype=float) / 2
+
+    # Drop repeated points, which have no direction
+    steps = np.diff(points, axis=0)
+    keep = np.concatenate([[True], np.hypot(steps[:, 0], steps[:, 1]) > 0])
+    points, half_widths = points[keep], half_widths[keep]
+    if len(points) < 2:
+        return np.empty((0, 4, 2))
+
+    # Unit direction of each segment, and its perpendicular (rotated 90 degrees anticlockwise)
+    steps = np.diff(points, axis=0)
+    directions = steps / np.hypot(steps[:, 0], steps[:, 1])[:, None]
+    normals = np.column_stack([-directions[:, 1], directions[:, 0]])
+
+    # Offset from each point to the left-hand edge of the band, at the start and end of each segment
+    start_offsets = normals * half_widths[:-1, None]
+    end_offsets = normals * half_widths[1:, None]
+
+    if mitre and len(normals) > 1:
+        # At each bend, both segments share a corner along the bisector of their normals,
+        # pushed out so the edges stay parallel to each segment
+        bisectors = normals[:-1] + normals[1:]
+        lengths = np.hypot(bisectors[:, 0], bisectors[:, 1])
+        # A complete reversal has no bisector, so keep the segments' own ends there
+        valid = lengths > 1e-9
+        bisectors[valid] /= lengths[valid, None]
+        cosines = np.einsum("ij,ij->i", bisectors, normals[1:])
+        # Leave turns too sharp for the mitre limit unmitred, as SVG does for strokes
+        valid &= cosines * mitre_limit >= 1
+        scale = 1 / np.where(valid, cosines, 1.0)
+        joins = bisectors * (half_widths[1:-1] * scale)[:, None]
+        end_offsets[:-1][valid] = joins[valid]
+        start_offsets[1:][valid] = joins[valid]
+
+    starts, ends = points[:-1], points[1:]
+    return np.stack([starts + start_offsets, starts - start_offsets,
+                     ends - end_offsets, ends + end_offsets], axis=1)
+
+
+def data_transform_kwargs(ax):
+    """
+    Return the keyword arguments that place lon/lat data on ax: the PlateCarree
+    transform on a cartopy map, or nothing on ordinary axes (passing transform=None
+    would put the artist in pixel coordinates).
+    """
+    if hasattr(ax, "projection"):
+        import cartopy.crs as ccrs
+        return {"transform": ccrs.PlateCarree()}
+    return {}
+
+
+def draw_flow_path(ax, lons, lats, widths, color, alpha=1.0, mitre=True, zorder=2):
+    """
+    Draw a whole flow path as continuous bars, with the width at each point given by widths.
+    The trapezoids are built by flow_band_polygons() and drawn as a single
+    PolyCollection, so even paths with thousands of segments add only one artist.
+    Returns:
+        matplotlib.collections.PolyCollection: The collection added to the axes
+    """
+    polygons = flow_band_polygons(lons, lats, widths, mitre=mitre)
+    # No border (edgecolor matches facecolor for seamless look)
+    collection = PolyCollection(polygons, closed=True,
+                                facecolors=color, edgecolors=color,
+                                linewidths=0, alpha=alpha, zorder=zorder,
+                                **data_transform_kwargs(ax))
+    ax.add_collection(collection)
+    return collection
+
+
+def path_widths(paths, widths):
+    """
+    Work out the band width at each point of each path.
+    Args:
+        paths (list): Path arrays
+        widths: Either a number, the width (in degrees) of the band at the largest
+                value in any path, with other widths in proportion to their values;
+                or a list with an array of widths for each path
+    Returns:
+        list: An array of widths for each path
+    """
+    if np.isscalar(widths):
+        max_value = max((np.abs(path[:, VALUE]).max() for path in paths if len(path)), default=0)
+        scale = widths / max_value if max_value > 0 else 0.0
+        return [np.abs(path[:, VALUE]) * scale for path in paths]
+    return [np.asarray(w, dtype=float) for w in widths]
+
+
+def simplify_indices(lons, lats, widths, tolerance):
+    """
+    Choose which points of a flow path to keep, with the Douglas-Peucker algorithm.
+    A point may be dropped if the simplified band stays within tolerance of the
+    original. The error counts both the point's distance from the simplified line
+    and half the change in band width there, since a change in the number of troops
+    (or vehicles) moves the band's edges even when the path itself is straight.
+    Args:
+        lons, lats, widths (numpy.ndarray): Coordinates and band width of each point
+        tolerance (float): Largest allowed error, in coordinate units
+    Returns:
+        numpy.ndarray: Indices of the points to keep, in order
+    """
+    n = len(lons)
+    if n <= 2 or tolerance <= 0:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Work through ranges of points with an explicit stack, as paths can be too long to recurse
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = slice(first + 1, last)
+        dx, dy = lons[last] - lons[first], lats[last] - lats[first]
+        px, py = lons[inner] - lons[first], lats[inner] - lats[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared > 0:
+            # Position of each point's projection along the line, from 0 (first) to 1 (last)
+            t = np.clip((px * dx + py * dy) / length_squared, 0.0, 1.0)
+        else:
+            t = np.zeros(last - first - 1)
+        distances = np.hypot(px - t * dx, py - t * dy)
+        width_errors = np.abs(widths[inner] - (widths[first] + t * (widths[last] - widths[first]))) / 2
+        errors = distances + width_errors
+
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            middle = first + 1 + worst
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return np.flatnonzero(keep)
+
+
+def simplified_indices(path, widths, tolerance):
+    """
+    Cached version of simplify_indices() for a path array.
+    The tolerance is rounded down to a power of two (a zoom level), so renders at
+    similar resolutions share one result while the error stays within the tolerance.
+    Results are kept while the path array exists.
+    """
+    if tolerance <= 0 or len(path) <= 2:
+        return np.arange(len(path))
+    level = math.floor(math.log2(tolerance))
+    key = (id(path), level, hash(widths.tobytes()))
+    cached = _lod_cache.get(key)
+    if cached is not None and cached[0]() is path:
+        return cached[1]
+
+    indices = simplify_indices(path[:, LON], path[:, LAT], widths, 2.0 ** level)
+
+    # Forget the entry when the path array is garbage collected, so its id can be reused
+    def forget(_, key=key):
+        _lod_cache.pop(key, None)
+    _lod_cache[key] = (weakref.ref(path, forget), indices)
+    return indices
+
+
+def lod_tolerance(ax, extent, dpi, pixels=0.5):
+    """
+    Work out the simplification tolerance that is invisible at the output resolution.
+    Args:
+        ax: The axes the paths are drawn on
+        extent (tuple): (lon_min, lon_max, lat_min, lat_max) shown by the axes
+        dpi (int): Resolution the figure will be saved or rendered at
+        pixels (float): Largest allowed error, in output pixels
+    Returns:
+        float: Tolerance in coordinate units
+    """
+    box = ax.get_position()
+    fig_width, fig_height = ax.figure.get_size_inches()
+    width_pixels = box.width * fig_width * dpi
+    height_pixels = box.height * fig_height * dpi
+    if width_pixels <= 0 or height_pixels <= 0:
+        return 0.0
+    # With an equal aspect ratio, the more crowded direction sets the size of a pixel
+    units_per_pixel = max((extent[1] - extent[0]) / width_pixels,
+                          (extent[3] - extent[2]) / height_pixels)
+    return units_per_pixel * pixels
+
+
+def render_flow_map(paths, widths=0.8, colors=None, labels=None, ax=None, figsize=(18, 9),
+                    title=None, padding=0.15, mitre=True, legend_loc="upper right",
+                    output=None, dpi=150, lod=True, lod_pixels=0.5, lod_dpi=None):
+    """
+    Draw paths as a flow map, with the band width following each path's values.
+    Args:
+        paths (list): Path arrays (see make_path())
+        widths: Width of the widest band in degrees, or a list of width arrays (see path_widths())
+        colors (list): A colour per path (defaults to matplotlib's colour cycle)
+        labels (list): Optional legend label per path
+        ax: Axes to draw on; if None, a new figure is created and its limits set to the data
+        figsize (tuple): Size of a new figure, in inches
+        title (str): Optional title
+        padding (float): Space around the data in a new figure, as a fraction of its extent
+        mitre (bool): Join segments with mitred corners
+        legend_loc (str): Position of the legend, if there are labels
+        output (str): If given, save the figure to this file (for example a PNG)
+        dpi (int): Resolution of the saved file
+        lod (bool): Simplify each path to the output resolution before building its
+                    bands (see simplify_indices()), so that dense paths cost no more
+                    to draw than the pixels they cover
+        lod_pixels (float): Largest error the simplification may introduce, in pixels
+        lod_dpi (int): Resolution to simplify for (defaults to dpi)
+    Returns:
+        tuple: (figure, axes)
+    """
+    created = ax is None
+    if created:
+        fig, ax = plt.subplots(figsize=figsize)
+    else:
+        fig = ax.figure
+
+    if colors is None:
+        cycle = plt.rcParams["axes.prop_cycle"].by_key().get("color", ["#2c3e50"])
+        colors = [cycle[i % len(cycle)] for i in range(len(paths))]
+
+    points = np.concatenate([path[:, :2] for path in paths]) if paths else np.zeros((1, 2))
+    (lon_min, lat_min), (lon_max, lat_max) = points.min(axis=0), points.max(axis=0)
+    lon_padding = max(lon_max - lon_min, 1e-6) * padding
+    lat_padding = max(lat_max - lat_min, 1e-6) * padding
+    extent = (lon_min - lon_padding, lon_max + lon_padding,
+              lat_min - lat_padding, lat_max + lat_padding)
+    if created:
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
+        ax.set_aspect("equal", adjustable="box")
+
+    tolerance = lod_tolerance(ax, extent, lod_dpi or dpi, lod_pixels) if lod else 0.0
+    for path, width, color in zip(paths, path_widths(paths, widths), colors):
+        kept = simplified_indices(path, width, tolerance)
+        draw_flow_path(ax, path[kept, LON], path[kept, LAT], width[kept], color, mitre=mitre)
+
+    if title:
+        ax.set_title(title, fontsize=16, fontweight="bold", pad=20)
+    if labels:
+        handles = [mpatches.Patch(color=color, label=label) for color, label in zip(colors, labels)]
+        ax.legend(handles=handles, loc=legend_loc, fontsize=10)
+
+    if output:
+        fig.savefig(output, dpi=dpi, bbox_inches="tight")
+        print(f"Flow map saved as {output}")
+    return fig, ax
+
+
+def path_positions(paths, fraction):
+    """
+    Work out where along each path a moving marker is at a point in the animation.
+    If every path has times, all paths share one clock running from the earliest to
+    the latest time, and paths that have not started or have finished are left out.
+    Otherwise each marker is the given fraction of the way through its path's points.
+    Args:
+        paths (list): Path arrays
+        fraction (float): How far through the animation, from 0 to 1
+    Returns:
+        tuple: (lons, lats) arrays of marker positions
+    """
+    if not paths:
+        return np.array([]), np.array([])
+    timed = all(path.shape[1] > TIME for path in paths)
+    if timed:
+        start = min(path[0, TIME] for path in paths if len(path))
+        end = max(path[-1, TIME] for path in paths if len(path))
+        now = start + (end - start) * fraction
+
+    lons, lats = [], []
+    for path in paths:
+        if len(path) == 0:
+            continue
+        if timed:
+            if not path[0, TIME] <= now <= path[-1, TIME]:
+                continue
+            lons.append(np.interp(now, path[:, TIME], path[:, LON]))
+            lats.append(np.interp(now, path[:, TIME], path[:, LAT]))
+        else:
+            position = fraction * (len(path) - 1)
+            steps = np.arange(len(path))
+            lons.append(np.interp(position, steps, path[:, LON]))
+            lats.append(np.interp(position, steps, path[:, LAT]))
+    return np.array(lons), np.array(lats)
+
+
+def tight_crop_box(fig, pad_inches=0.1):
+    """
+    Return the (rows, columns) slices of the canvas image covered by the figure's
+    tight bounding box, matching what savefig(bbox_inches='tight') would keep.
+    The figure must have been drawn at least once.
+    """
+    renderer = fig.canvas.get_renderer()
+    bbox = fig.get_tightbbox(renderer).padded(pad_inches)
+    width, height = fig.canvas.get_width_height()
+    x0 = max(int(np.floor(bbox.x0 * fig.dpi)), 0)
+    x1 = min(int(np.ceil(bbox.x1 * fig.dpi)), width)
+    y0 = max(int(np.floor(bbox.y0 * fig.dpi)), 0)
+    y1 = min(int(np.ceil(bbox.y1 * fig.dpi)), height)
+    # Image rows run from the top of the figure, figure coordinates from the bottom
+    return slice(height - y1, height - y0), slice(x0, x1)
+
+
+def prepare_canvas(fig, dpi=100, mode="blit"):
+    """
+    Draw the static parts of a figure, ready for render_frame(). Artists that move
+    should either be added by the frame's draw function or be marked animated, so
+    that they are not part of this background.
+    Args:
+        fig: The figure
+        dpi (int): Resolution of the frames
+        mode (str): "blit" to cache the drawn figure as a background for every frame,
+                    or "full" to redraw the whole figure for each frame
+    Returns:
+        tuple: (background, rows, columns); background is None in "full" mode, and
+               rows and columns are the slices that crop frames to the tight bounding box
+    """
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    rows, columns = tight_crop_box(fig)
+    background = None
+    # Blitting needs an Agg-based canvas, which can copy and restore regions
+    if mode == "blit" and hasattr(fig.canvas, "copy_from_bbox"):
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+    return background, rows, columns
+
+
+def render_frame(fig, draw, frame, background, rows, columns):
+    """
+    Render one animation frame and return it as an RGBA array.
+    draw(frame) updates or creates the moving artists and returns them. With a
+    background (blitting), the cached image is restored and only those artists are
+    drawn on top of it; otherwise the whole figure is redrawn.
+    The frame is read straight from the canvas, without encoding it to PNG and
+    decoding it again. The returned array is a view of the canvas buffer, so it is
+    only valid until the next frame is rendered: write it out (or copy it) first.
+    Args:
+        fig: The figure
+        draw (callable): Function of the frame number returning the moving artists
+        frame (int): Frame number
+        background, rows, columns: As returned by prepare_canvas()
+    Returns:
+        numpy.ndarray: The frame, cropped to the figure's tight bounding box
+    """
+    if background is not None:
+        fig.canvas.restore_region(background)
+        # Draw in the same order as a full redraw would, lowest zorder first
+        for artist in sorted(draw(frame), key=lambda artist: artist.get_zorder()):
+            fig.draw_artist(artist)
+    else:
+        artists = draw(frame)
+        fig.canvas.draw()
+        # A full redraw leaves out animated artists, so draw those on top
+        for artist in sorted(artists, key=lambda artist: artist.get_zorder()):
+            if artist.get_animated():
+                fig.draw_artist(artist)
+    return np.asarray(fig.canvas.buffer_rgba())[rows, columns]
+
+
+def render_frames(fig, draw, frames, dpi=100, mode="blit"):
+    """
+    Render animation frames, yielding each one as an RGBA array.
+    In "blit" mode the static parts of the figure are drawn once and cached; each
+    frame restores that cached image and draws only the moving artists on top of it.
+    In "full" mode the whole figure is redrawn for every frame. As with
+    render_frame(), each array is a view of the canvas that is only valid until the
+    next frame is rendered.
+    Args:
+        fig: The figure
+        draw (callable): Function of the frame number returning the moving artists
+        frames (iterable): Frame numbers to render
+        dpi (int): Resolution of the frames
+        mode (str): "blit" or "full"
+    Yields:
+        numpy.ndarray: Each frame, cropped to the figure's tight bounding box
+    """
+    original_dpi = fig.dpi
+    try:
+        background, rows, columns = prepare_canvas(fig, dpi, mode)
+        for frame in frames:
+            yield render_frame(fig, draw, frame, background, rows, columns)
+    finally:
+        fig.set_dpi(original_dpi)
+
+
+# Encoder settings for each format streamed to ffmpeg: the codec, the pixel format
+# it encodes, options used with every preset, and options for each preset. "high"
+# gives the best picture, "small" the smallest file, and "balanced" is in between.
+FFMPEG_FORMATS = {
+    "mp4": {
+        "codec": "libx264",
+        "pix_fmt": "yuv420p",
+        # Put the index at the start of the file, so that browsers can start playing at once
+        "options": ["-movflags", "+faststart", "-tune", "animation"],
+        "presets": {
+            "high": ["-crf", "18", "-preset", "slow"],
+            "balanced": ["-crf", "23", "-preset", "medium"],
+            "small": ["-crf", "28", "-preset", "veryslow"],
+        },
+    },
+    "webm": {
+        "codec": "libvpx-vp9",
+        "pix_fmt": "yuv420p",
+        # Constant quality (no target bitrate), encoded in several threads
+        "options": ["-b:v", "0", "-row-mt", "1"],
+        "presets": {
+            "high": ["-crf", "24", "-deadline", "good", "-cpu-used", "2"],
+            # The realtime mode is about ten times faster, for slightly larger files
+            "balanced": ["-crf", "32", "-deadline", "realtime", "-cpu-used", "8"],
+            "small": ["-crf", "40", "-deadline", "good", "-cpu-used", "2"],
+        },
+    },
+    "webp": {
+        "codec": "libwebp_anim",
+        "pix_fmt": "yuv420p",
+        "options": ["-loop", "0"],
+        "presets": {
+            "high": ["-quality", "90", "-compression_level", "4"],
+            "balanced": ["-quality", "75", "-compression_level", "4"],
+            "small": ["-quality", "50", "-compression_level", "5"],
+        },
+    },
+    "apng": {
+        # Lossless, so every preset gives the same picture and much the same size
+        "codec": "apng",
+        "pix_fmt": "rgb24",
+        "options": ["-plays", "0"],
+        "presets": {"high": [], "balanced": [], "small": []},
+    },
+}
+
+# Quality presets accepted by FrameWriter
+PRESETS = ("high", "balanced", "small")
+
+
+class FrameWriter:
+    """
+    Write animation frames to a file one at a time, as they are rendered, so that
+    memory use does not grow with the number of frames. The format is chosen from
+    the file extension:
+    - .gif is written with Pillow, using one palette taken from the first frame and
+      storing only the rectangle of each frame that changed since the previous one
+    - .mp4 (H.264), .webm (VP9), .webp (animated WebP) and .apng (animated PNG) are
+      piped to ffmpeg, which needs the imageio-ffmpeg package (pip install imageio-ffmpeg)
+    The preset ("high", "balanced" or "small") chooses between picture quality and
+    file size for the ffmpeg formats (see FFMPEG_FORMATS); GIF files are always
+    written the same way.
+    """
+
+    def __init__(self, path, fps=10, preset="balanced"):
+        self.path = path
+        self.fps = fps
+        self.preset = preset
+        self.frames = 0
+        self.extension = path.rsplit(".", 1)[-1].lower()
+        self._writer = None
+        self._file = None
+
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown preset: {preset} (use {', '.join(PRESETS)})")
+        if self.extension == "gif":
+            self._file = open(path, "wb")
+        elif self.extension in FFMPEG_FORMATS:
+            import imageio_ffmpeg
+            # ffmpeg is started when the first frame arrives, as it needs the frame size
+            self._ffmpeg = imageio_ffmpeg
+            self._format = FFMPEG_FORMATS[self.extension]
+        else:
+            formats = ", ".join("." + extension for extension in ["gif", *FFMPEG_FORMATS])
+            raise ValueError(f"Unsupported animation format: {path} (use {formats})")
+
+    def _write_gif_frame(self, frame):
+        """Append one RGB frame to the GIF file, as the rectangle that changed."""
+        from PIL import Image, GifImagePlugin
+
+        duration = int(1000 / self.fps)
+        if self.frames == 0:
+            # Quantise the first frame to a palette shared by all frames; the background
+            # never changes, so this palette suits the rest of the animation too
+            self._palette = Image.fromarray(frame).quantize(256, method=Image.Quantize.MEDIANCUT)
+            header, _ = GifImagePlugin.getheader(self._palette, info={"loop": 0, "optimize": False})
+            self._file.write(b"".join(header))
+            image, offset = self._palette, (0, 0)
+        else:
+            # Find the rows that changed, then the columns that changed within those rows
+            changed = np.not_equal(frame, self._previous)
+            rows = np.flatnonzero(changed.reshape(changed.shape[0], -1).any(axis=1))
+            if len(rows) == 0:
+                # Nothing moved: repeat one pixel so that the frame still takes its time
+                top, bottom, left, right = 0, 1, 0, 1
+            else:
+                top, bottom = rows[0], rows[-1] + 1
+                columns = np.flatnonzero(changed[top:bottom].any(axis=(0, 2)))
+                left, right = columns[0], columns[-1] + 1
+            image = Image.fromarray(frame[top:bottom, left:right]).quantize(
+                palette=self._palette, dither=Image.Dither.NONE)
+            offset = (int(left), int(top))
+        # disposal=1 leaves the previous frame in place under the changed rectangle
+        for data in GifImagePlugin.getdata(image, offset=offset, duration=duration, disposal=1):
+            self._file.write(data)
+        # Keep a copy, as the frame may be a view of a buffer that is about to be redrawn
+        self._previous = frame.copy()
+
+    def _start_ffmpeg(self, width, height):
+        """Start an ffmpeg process that reads raw RGB frames from a pipe."""
+        settings = self._format
+        # quality=None leaves the quality to the preset's own options
+        self._writer = self._ffmpeg.write_frames(
+            self.path, (width, height), fps=self.fps, pix_fmt_in="rgb24",
+            pix_fmt_out=settings["pix_fmt"], codec=settings["codec"], quality=None,
+            macro_block_size=1, output_params=settings["options"] + settings["presets"][self.preset])
+        self._writer.send(None)
+
+    def write(self, frame):
+        """Encode one RGBA or RGB frame."""
+        frame = frame[..., :3]
+        if self.extension == "gif":
+            self._write_gif_frame(frame)
+        else:
+            if self._format["pix_fmt"] == "yuv420p":
+                # Colour is stored at half resolution, which needs an even width and height
+                frame = frame[:frame.shape[0] // 2 * 2, :frame.shape[1] // 2 * 2]
+            if self._writer is None:
+                self._start_ffmpeg(frame.shape[1], frame.shape[0])
+            self._writer.send(np.ascontiguousarray(frame))
+        self.frames += 1
+
+    def close(self):
+        """Finish the file."""
+        if self._file is not None:
+            self._file.write(b";")  # GIF trailer
+            self._file.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def animate_flow_map(paths, widths=0.8, output="flow_map.gif", frames=200, fps=10, dpi=100,
+                     mode="blit", marker_size=6, marker_color="black", preset="balanced",
+                     **render_options):
+    """
+    Animate a flow map, with a marker moving along every path.
+    The map is drawn once by render_flow_map(), exactly as for a static image, and
+    the markers are then blitted over it for each frame and streamed to the output file.
+    Args:
+        paths (list): Path arrays (see make_path())
+        widths: As for render_flow_map()
+        output (str): Animation file (.gif, .mp4, .webm, .webp or .apng)
+        frames (int): Number of frames
+        fps (int): Frames per second
+        dpi (int): Resolution of the frames
+        mode (str): "blit" or "full" (see render_frames())
+        marker_size (float): Size of the moving markers, in points
+        marker_color: Colour of the moving markers
+        preset (str): "high", "balanced" or "small" (see FrameWriter)
+        **render_options: Passed on to render_flow_map()
+    Returns:
+        str: The output file
+    """
+    render_options.pop("output", None)
+    render_options.setdefault("lod_dpi", dpi)
+    fig, ax = render_flow_map(paths, widths, **render_options)
+    # One artist holds every marker, so the frame cost does not grow with the number of paths
+    markers, = ax.plot([], [], "o", markersize=marker_size, color=marker_color,
+                       zorder=10, animated=True, **data_transform_kwargs(ax))
+
+    def draw(frame):
+        markers.set_data(*path_positions(paths, frame / max(frames - 1, 1)))
+        return [markers]
+
+    with FrameWriter(output, fps=fps, preset=preset) as writer:
+        for image in render_frames(fig, draw, range(frames), dpi=dpi, mode=mode):
+            writer.write(image)
+    plt.close(fig)
+    print(f"Animation saved as {output} ({writer.frames} frames)")
+    return output
+
+
+def main():
+    """Command line entry point: draw a flow map (and optionally an animation) from a file."""
+    parser = argparse.ArgumentParser(description="Draw a flow map from a CSV or Parquet file "
+                                                 "with one row per point.")
+    parser.add_argument("file", help="CSV or Parquet file")
+    parser.add_argument("--path-column", default="path", help="Column identifying each path")
+    parser.add_argument("--lon-column", default="lon")
+    parser.add_argument("--lat-column", default="lat")
+    parser.add_argument("--value-column", default="value", help="Column shown by the band width")
+    parser.add_argument("--time-column", default=None, help="Optional column with the time of each point")
+    parser.add_argument("--width", type=float, default=0.8, help="Width of the widest band, in degrees")
+    parser.add_argument("--title", default=None)
+    parser.add_argument("--output", default="flow_map.png", help="Static image to write")
+    parser.add_argument("--animation", default=None,
+                        help="Optional animation to write (.gif, .mp4, .webm, .webp or .apng)")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--preset", choices=PRESETS, default="balanced",
+                        help="Animation quality, for the formats encoded by ffmpeg")
+    args = parser.parse_args()
+
+    paths = load_paths(args.file, args.path_column, args.lon_column, args.lat_column,
+                       args.value_column, args.time_column)
+    print(f"Loaded {len(paths):,} paths with {sum(len(p) for p in paths.values()):,} points")
+    paths = list(paths.values())
+    fig, ax = render_flow_map(paths, args.width, title=args.title, output=args.output)
+    plt.close(fig)
+    if args.animation:
+        animate_flow_map(paths, args.width, output=args.animation, frames=args.frames,
+                         preset=args.preset, title=args.title)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ HOW TO RUN:
 1. Install required dependencies:
    pip install matplotlib numpy
    (Optional, for map background: pip install cartopy)
-   (Optional, for better animated GIF support: pip install imageio)
+   (Optional, for MP4, WebM, WebP or APNG output: pip install imageio-ffmpeg)
 
 2. Run the script:
    python plot_minard.py
@@ -17,18 +17,33 @@ HOW TO RUN:
 3. The script will generate 'minard_plot.png' and 'minard_animation.gif' 
    in the current directory. The animated GIF will show Napoleon moving
    along the campaign route when viewed in an image viewer that supports
-   animated GIFs (most web browsers and image viewers).
+   animated GIFs (most web browsers and image viewers). Set ANIMATION_FILE
+   to a .mp4, .webm, .webp or .apng name to save the animation in one of those
+   formats instead, and ANIMATION_PRESET to choose between quality and file size.
 """
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib.patches import Polygon, FancyBboxPatch, Arc
 from matplotlib.patches import ConnectionPatch
-from matplotlib.animation import FuncAnimation
+from matplotlib.transforms import Affine2D
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import numpy as np
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import flow_map
+from flow_map import FrameWriter, draw_flow_path, make_path, render_flow_map
 
 # Try to import cartopy for map background, fallback to simple if not available
 try:
+    import cartopy
     import cartopy.crs as ccrs
     import cartopy.feature as cfeature
     HAS_CARTOPY = True
@@ -68,185 +83,21 @@ temperatures = [
     {"date": "Dec 7", "temp": -30, "lon": 24.0},
 ]
 
+# The advance and retreat as flow_map path arrays, with columns lon, lat, troops
+advance_path = make_path([p["lon"] for p in advance], [p["lat"] for p in advance],
+                         [p["troops"] for p in advance])
+retreat_path = make_path([p["lon"] for p in retreat], [p["lat"] for p in retreat],
+                         [p["troops"] for p in retreat])
+
 
 def draw_flow_segment(ax, x1, y1, x2, y2, width1, width2, color, alpha=1.0):
     """
-    Draw a flow segment as a trapezoid (rhomboid) perpendicular to the direction of travel.
-    Creates smooth transitions between segments.
+    Draw a single flow segment as a trapezoid (rhomboid) perpendicular to the direction of travel.
     width1: width at start point
     width2: width at end point
     """
-    # Calculate direction vector
-    dx = x2 - x1
-    dy = y2 - y1
-    length = np.sqrt(dx**2 + dy**2)
-    
-    if length == 0:
-        return
-    
-    # Normalise direction vector
-    dx_norm = dx / length
-    dy_norm = dy / length
-    
-    # Perpendicular vector (rotate 90 degrees counterclockwise)
-    perp_x = -dy_norm
-    perp_y = dx_norm
-    
-    # Half-widths in coordinate units (degrees)
-    half_width1 = width1 / 2
-    half_width2 = width2 / 2
-    
-    # Calculate the four corners of the trapezoid
-    # Start point offsets
-    p1 = (x1 + perp_x * half_width1, y1 + perp_y * half_width1)
-    p2 = (x1 - perp_x * half_width1, y1 - perp_y * half_width1)
-    # End point offsets
-    p3 = (x2 - perp_x * half_width2, y2 - perp_y * half_width2)
-    p4 = (x2 + perp_x * half_width2, y2 + perp_y * half_width2)
-    
-    # Create polygon with no border (edgecolor matches facecolor for seamless look)
-    if HAS_CARTOPY and hasattr(ax, 'projection'):
-        # For cartopy, we need to specify the transform
-        polygon = Polygon([p1, p2, p3, p4], closed=True, 
-                          facecolor=color, edgecolor=color, 
-                          linewidth=0, alpha=alpha, zorder=2,
-                          transform=ccrs.PlateCarree())
-    else:
-        polygon = Polygon([p1, p2, p3, p4], closed=True, 
-                          facecolor=color, edgecolor=color, 
-                          linewidth=0, alpha=alpha, zorder=2)
-    
-    ax.add_patch(polygon)
-
-
-# Create figure with main map emphasised and minimal temperature chart
-fig = plt.figure(figsize=(18, 12))
-gs = fig.add_gridspec(10, 1, hspace=0.05)  # Reduced spacing to bring temperature graph closer
-
-# Create main map axis with or without cartopy
-if HAS_CARTOPY:
-    ax1 = fig.add_subplot(gs[0:9, 0], projection=ccrs.PlateCarree())
-else:
-    ax1 = fig.add_subplot(gs[0:9, 0])  # Main map - takes 9/10 of space
-
-ax2 = fig.add_subplot(gs[9, 0])   # Temperature - minimal, takes 1/10
-
-# Extract coordinates and troop numbers
-advance_lons = [p["lon"] for p in advance]
-advance_lats = [p["lat"] for p in advance]
-advance_troops = [p["troops"] for p in advance]
-
-retreat_lons = [p["lon"] for p in retreat]
-retreat_lats = [p["lat"] for p in retreat]
-retreat_troops = [p["troops"] for p in retreat]
-
-# Scale factor for width (troops to visual width in degrees)
-# The coordinate system spans ~13.6 degrees longitude and ~1.9 degrees latitude
-# Increased width to make bars chunkier and more visible
-max_troops = max(max(advance_troops), max(retreat_troops))
-desired_max_width = 0.8  # degrees - increased from 0.25 for chunkier bars
-scale_factor = desired_max_width / max_troops
-
-print(f"Scale factor: {scale_factor:.2e}")
-print(f"Max troops: {max_troops:,}")
-print(f"Max bar width: {max_troops * scale_factor:.4f} degrees")
-
-# Draw advance path as continuous bars with smooth transitions (trapezoids)
-for i in range(len(advance) - 1):
-    width1 = advance_troops[i] * scale_factor
-    width2 = advance_troops[i + 1] * scale_factor
-    draw_flow_segment(
-        ax1,
-        advance_lons[i], advance_lats[i],
-        advance_lons[i + 1], advance_lats[i + 1],
-        width1, width2,
-        "#d4a574",
-        alpha=1.0
-    )
-
-# Draw retreat path as continuous bars with smooth transitions (trapezoids)
-for i in range(len(retreat) - 1):
-    width1 = retreat_troops[i] * scale_factor
-    width2 = retreat_troops[i + 1] * scale_factor
-    draw_flow_segment(
-        ax1,
-        retreat_lons[i], retreat_lats[i],
-        retreat_lons[i + 1], retreat_lats[i + 1],
-        width1, width2,
-        "#2c3e50",
-        alpha=1.0
-    )
+    draw_flow_path(ax, [x1, x2], [y1, y2], [width1, width2], color, alpha=alpha, mitre=False)
 
-# Add annotations for all locations with leader lines
-all_points = advance + retreat
-seen_locations = set()
-
-for point in all_points:
-    loc_key = (point["lon"], point["lat"])
-    if loc_key in seen_locations:
-        continue
-    seen_locations.add(loc_key)
-    
-    # Extract location name
-    name_parts = point["name"].split("(")
-    city_name = name_parts[0].strip()
-    country = name_parts[1].strip(")") if len(name_parts) > 1 else ""
-    
-    # Build label without coordinates (remove battle info from text - shown as marker)
-    label_parts = [city_name]
-    if country:
-        label_parts.append(f"({country})")
-    if "date" in point:
-        label_parts.append(point["date"])
-    # Battle info removed - will be shown as marker at location with label
-    
-    label = "\n".join(label_parts)
-    
-    # Position annotation offset based on location (further away to avoid covering plot)
-    offset_x = 50 if point["lon"] < 30 else -50
-    offset_y = 50 if point["lat"] < 55 else -50
-    
-    # No background or border for annotations
-    ax1.annotate(
-        label,
-        (point["lon"], point["lat"]),
-        xytext=(offset_x, offset_y),
-        textcoords="offset points",
-        fontsize=9,
-        bbox=None,  # No box
-        zorder=5,
-        ha="left" if offset_x > 0 else "right",
-        color="red" if point.get("battle", False) else "black",
-        weight="bold" if point.get("battle", False) else "normal"
-    )
-    
-    # Add leader line from annotation to location
-    # Draw a line from the location to near the annotation
-    line_end_x = point["lon"] + offset_x * 0.4
-    line_end_y = point["lat"] + offset_y * 0.4
-    
-    if HAS_CARTOPY:
-        # For cartopy, we need to use transform
-        ax1.plot(
-            [point["lon"], line_end_x],
-            [point["lat"], line_end_y],
-            color="gray",
-            linestyle="--",
-            linewidth=0.8,
-            alpha=0.6,
-            transform=ccrs.PlateCarree(),
-            zorder=3
-        )
-    else:
-        ax1.plot(
-            [point["lon"], line_end_x],
-            [point["lat"], line_end_y],
-            color="gray",
-            linestyle="--",
-            linewidth=0.8,
-            alpha=0.6,
-            zorder=3
-        )
 
 # Add battle markers at exact locations
 def draw_battle_marker(ax, x, y, battle_name=None, transform=None):
@@ -296,178 +147,15 @@ def draw_battle_marker(ax, x, y, battle_name=None, transform=None):
                    fontsize=8, color="#8b0000", weight="bold",
                    zorder=8)
 
-# Draw battle markers at exact battle locations with labels
-for point in all_points:
-    if point.get("battle", False) and "battle_name" in point:
-        battle_name = point["battle_name"]
-        if HAS_CARTOPY:
-            draw_battle_marker(ax1, point["lon"], point["lat"], 
-                             battle_name=battle_name, transform=ccrs.PlateCarree())
-        else:
-            draw_battle_marker(ax1, point["lon"], point["lat"], battle_name=battle_name)
-
-# Set axis limits with some padding
-all_lons = advance_lons + retreat_lons
-all_lats = advance_lats + retreat_lats
-lon_min, lon_max = min(all_lons), max(all_lons)
-lat_min, lat_max = min(all_lats), max(all_lats)
-
-# Add padding
-lon_padding = (lon_max - lon_min) * 0.15
-lat_padding = (lat_max - lat_min) * 0.15
-
-# Calculate plot edges
-plot_lon_min = lon_min - lon_padding
-plot_lon_max = lon_max + lon_padding
-plot_lat_min = lat_min - lat_padding
-plot_lat_max = lat_max + lat_padding
-
-# Define the three major rivers with extended paths to plot edges
-# 1. Niemen/Neman River (flows from south to north, crossed at Kowno ~24.0°E, 54.9°N)
-niemen_river = [
-    (24.0, plot_lat_min),  # Start at southern edge
-    (23.8, 54.2),
-    (23.9, 54.5),
-    (24.0, 54.7),
-    (24.0, 54.9),  # Kowno crossing point
-    (24.1, 55.1),
-    (24.2, 55.3),
-    (24.3, 55.5),
-    (24.4, plot_lat_max),  # Extend to northern edge
-]
-
-# 2. Dnieper River (flows from north to south, through the region)
-dnieper_river = [
-    (30.5, plot_lat_max),  # Start at northern edge
-    (30.4, 55.8),
-    (30.3, 55.6),
-    (30.2, 55.4),
-    (30.2, 55.2),  # Near Vitebsk
-    (30.3, 55.0),
-    (30.5, 54.8),
-    (31.0, 54.6),  # Near Smolensk
-    (31.5, 54.4),
-    (32.0, 54.2),
-    (32.5, 54.0),
-    (33.0, 53.8),
-    (33.2, plot_lat_min),  # Extend to southern edge
-]
-
-# 3. Berezina River (flows from north to south, famous crossing at Studenka ~30.0°E, 54.4°N)
-berezina_river = [
-    (29.5, plot_lat_max),  # Start at northern edge
-    (29.4, 55.5),
-    (29.3, 55.2),
-    (29.2, 54.9),
-    (29.3, 54.6),
-    (29.5, 54.4),  # Near Studenka crossing
-    (29.7, 54.2),
-    (29.9, 54.0),
-    (30.0, 53.8),
-    (30.1, plot_lat_min),  # Extend to southern edge
-]
-
-# Add background map
-if HAS_CARTOPY:
-    # Set map extent
-    ax1.set_extent([lon_min - lon_padding, lon_max + lon_padding,
-                    lat_min - lat_padding, lat_max + lat_padding],
-                   crs=ccrs.PlateCarree())
-    
-    # Add map features
-    ax1.add_feature(cfeature.COASTLINE, linewidth=0.5, alpha=0.5, zorder=0)
-    ax1.add_feature(cfeature.BORDERS, linewidth=0.3, alpha=0.4, zorder=0)
-    ax1.add_feature(cfeature.LAND, facecolor="#f5f5dc", alpha=0.5, zorder=0)
-    ax1.add_feature(cfeature.OCEAN, facecolor="#e6f3ff", alpha=0.5, zorder=0)
-    
-    # Draw the three major rivers manually (more visible)
-    niemen_lons, niemen_lats = zip(*niemen_river)
-    dnieper_lons, dnieper_lats = zip(*dnieper_river)
-    berezina_lons, berezina_lats = zip(*berezina_river)
-    
-    ax1.plot(niemen_lons, niemen_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Niemen River", transform=ccrs.PlateCarree(), zorder=1)
-    ax1.plot(dnieper_lons, dnieper_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Dnieper River", transform=ccrs.PlateCarree(), zorder=1)
-    ax1.plot(berezina_lons, berezina_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Berezina River", transform=ccrs.PlateCarree(), zorder=1)
-    
-    # Add river labels (no background or border)
-    ax1.text(24.2, 54.6, "Niemen", fontsize=9, color="#2c5aa0", 
-             weight="bold", transform=ccrs.PlateCarree(), zorder=2)
-    ax1.text(31.5, 54.3, "Dnieper", fontsize=9, color="#2c5aa0", 
-             weight="bold", transform=ccrs.PlateCarree(), zorder=2)
-    ax1.text(29.5, 54.0, "Berezina", fontsize=9, color="#2c5aa0", 
-             weight="bold", transform=ccrs.PlateCarree(), zorder=2)
-    
-    ax1.gridlines(draw_labels=False, linewidth=0.5, alpha=0.3, linestyle="--", zorder=1)
-else:
-    # Simple background without cartopy
-    ax1.set_xlim(lon_min - lon_padding, lon_max + lon_padding)
-    ax1.set_ylim(lat_min - lat_padding, lat_max + lat_padding)
-    ax1.set_aspect("equal", adjustable="box")
-    ax1.set_facecolor("#f5f5dc")  # Light beige background
-    
-    # Draw the three major rivers manually
-    niemen_lons, niemen_lats = zip(*niemen_river)
-    dnieper_lons, dnieper_lats = zip(*dnieper_river)
-    berezina_lons, berezina_lats = zip(*berezina_river)
-    
-    ax1.plot(niemen_lons, niemen_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Niemen River", zorder=1)
-    ax1.plot(dnieper_lons, dnieper_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Dnieper River", zorder=1)
-    ax1.plot(berezina_lons, berezina_lats, color="#4a90e2", linewidth=2.5, 
-             alpha=0.7, label="Berezina River", zorder=1)
-    
-    # Add river labels (no background or border)
-    ax1.text(24.2, 54.6, "Niemen", fontsize=9, color="#2c5aa0", 
-             weight="bold", zorder=2)
-    ax1.text(31.5, 54.3, "Dnieper", fontsize=9, color="#2c5aa0", 
-             weight="bold", zorder=2)
-    ax1.text(29.5, 54.0, "Berezina", fontsize=9, color="#2c5aa0", 
-             weight="bold", zorder=2)
-    
-    ax1.grid(True, alpha=0.2, linestyle="--", linewidth=0.5, zorder=0)
-
-# Remove axis labels (no lat/lon on axes)
-ax1.set_xlabel("", fontsize=14)
-ax1.set_ylabel("", fontsize=14)
-ax1.set_title(
-    "Minard's Map of Napoleon's Russian Campaign, 1812\n"
-    "Bar width represents number of soldiers (perpendicular to direction of travel)",
-    fontsize=16,
-    fontweight="bold",
-    pad=20
-)
-
-# Add legend
-advance_patch = mpatches.Patch(color="#d4a574", label="Advance to Moscow")
-retreat_patch = mpatches.Patch(color="#2c3e50", label="Retreat from Moscow")
-ax1.legend(handles=[advance_patch, retreat_patch], loc="upper right", fontsize=10)
-
-# Create list of all path points for animation
-all_path_points = []
-all_path_troops = []
-all_path_is_retreat = []
-
-# Add advance path
-for i, point in enumerate(advance):
-    all_path_points.append((point["lon"], point["lat"]))
-    all_path_troops.append(point["troops"])
-    all_path_is_retreat.append(False)
-
-# Add retreat path (skip first Moscow point as it's duplicate)
-for i, point in enumerate(retreat[1:], start=1):
-    all_path_points.append((point["lon"], point["lat"]))
-    all_path_troops.append(point["troops"])
-    all_path_is_retreat.append(True)
 
 # Napoleon caricature drawing function
 def draw_napoleon_caricature(ax, x, y, size=1.0, is_sad=False, transform=None):
     """Draw a simple caricature of Napoleon with bigger head and hat"""
     scale = size * 0.2  # Increased scale for bigger head
-    
+    if transform is None:
+        # Passing transform=None to a patch would place it in pixels, not map coordinates
+        transform = ax.transData
+
     # Head (circle) - bigger
     head = mpatches.Circle((x, y), radius=scale * 1.2, 
                           facecolor="#f4d9a6", edgecolor="#8b6f47", 
@@ -620,145 +308,754 @@ def draw_napoleon_caricature(ax, x, y, size=1.0, is_sad=False, transform=None):
                cockade_red, cockade_white, cockade_blue, body, hand, left_eye, right_eye, mouth]
     return patches
 
-# Store Napoleon patches for animation (will be initialized in animation)
-napoleon_patches = []
-napoleon_at_moscow = False
 
-# Minimal temperature plot
-temp_lons = [t["lon"] for t in temperatures]
-temp_temps = [t["temp"] for t in temperatures]
+class NapoleonSprite:
+    """
+    The caricature drawn once in each mood (confident and sad), and then moved around
+    the map by changing a single offset transform. No patches are created or removed
+    while animating: each frame only moves the offset and shows the right mood.
+    The patches are animated artists, so normal redraws leave them out and they are
+    only drawn when render_frame() draws them over the background.
+    """
 
-ax2.plot(temp_lons, temp_temps, "-", color="#1976d2", linewidth=1.5, markersize=3)
-ax2.fill_between(temp_lons, temp_temps, 0, alpha=0.2, color="#1976d2")
-ax2.set_xlabel("", fontsize=9)
-ax2.set_ylabel("Temp (°C)", fontsize=9)
-ax2.tick_params(labelsize=8)
-ax2.grid(True, alpha=0.2, linestyle="--", linewidth=0.5)
-ax2.axhline(y=0, color="k", linestyle="-", linewidth=0.5)
-ax2.set_ylim(-35, 5)
+    def __init__(self, ax, size=1.0, transform=None):
+        """
+        Args:
+            ax: The map axis
+            size (float): Size of the caricature, as for draw_napoleon_caricature()
+            transform: Transform from map coordinates (defaults to ax.transData)
+        """
+        if transform is None:
+            transform = ax.transData
+        elif hasattr(transform, "_as_mpl_transform"):
+            # A cartopy CRS stands for a matplotlib transform that depends on the axis
+            transform = transform._as_mpl_transform(ax)
 
-# Adjust layout - move temperature graph closer to map
-fig.tight_layout()
-fig.subplots_adjust(hspace=0.05)  # Reduce vertical spacing between subplots
+        self.offset = Affine2D()
+        self.moods = {}
+        for is_sad in (False, True):
+            # Draw at the origin; the offset moves it to the current position
+            patches = draw_napoleon_caricature(ax, 0, 0, size=size, is_sad=is_sad,
+                                               transform=self.offset + transform)
+            for patch in patches:
+                patch.set_animated(True)
+                patch.set_visible(False)
+            self.moods[is_sad] = patches
 
-# Save static plot
-plt.savefig("minard_plot.png", dpi=300, bbox_inches="tight")
-print("Static plot saved as minard_plot.png")
+    def move(self, x, y, is_sad=False):
+        """
+        Move the caricature to (x, y) and show it in the given mood.
+        Returns:
+            list: The patches of the visible caricature
+        """
+        self.offset.clear().translate(x, y)
+        for mood, patches in self.moods.items():
+            for patch in patches:
+                patch.set_visible(mood == is_sad)
+        return self.moods[is_sad]
 
-# Create animation
-print("Creating animation...")
 
-def animate(frame):
-    """Animate Napoleon moving along the route"""
-    global napoleon_patches, napoleon_at_moscow
-    
-    # Calculate position along path - slower animation
-    total_frames = 400  # Increased from 200 to slow down Napoleon
-    progress = min(frame / total_frames, 0.999)  # Cap at 0.999 to avoid index errors
-    
-    # Find which segment we're on
-    num_points = len(all_path_points)
-    if num_points < 2:
-        return []
-    
-    segment_idx = int(progress * (num_points - 1))
-    segment_idx = min(segment_idx, num_points - 2)
-    
-    # Interpolate position within segment
-    segment_progress = (progress * (num_points - 1)) - segment_idx
-    
-    # Get start and end points of current segment
-    x1, y1 = all_path_points[segment_idx]
-    x2, y2 = all_path_points[segment_idx + 1]
-    
-    # Interpolate position
-    napoleon_x = x1 + (x2 - x1) * segment_progress
-    napoleon_y = y1 + (y2 - y1) * segment_progress
-    
-    # Check if we've reached Moscow (end of advance)
+# Natural Earth features drawn under the map, in drawing order, with their styles
+MAP_FEATURES = [
+    ("COASTLINE", {"linewidth": 0.5, "alpha": 0.5}),
+    ("BORDERS", {"linewidth": 0.3, "alpha": 0.4}),
+    ("LAND", {"facecolor": "#f5f5dc", "alpha": 0.5}),
+    ("OCEAN", {"facecolor": "#e6f3ff", "alpha": 0.5}),
+]
+
+# Directory of rendered map backgrounds, so that cartopy only has to load and draw
+# the features once for each map size; delete it to draw them again
+BACKGROUND_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_cache")
+
+
+def map_background_key(projection, extent, size, dpi, features=MAP_FEATURES):
+    """
+    Return the name of a cached map background, which changes whenever anything
+    that affects how the background looks changes.
+    Args:
+        projection (cartopy.crs.Projection): Projection of the map axis
+        extent (tuple): (x0, x1, y0, y1) of the map, in projection coordinates
+        size (tuple): (width, height) of the map axis in pixels
+        dpi (int): Resolution the figure is drawn at
+        features (list): (name, style) pairs for the Natural Earth features
+    Returns:
+        str: A hexadecimal hash
+    """
+    description = json.dumps({
+        "projection": projection.proj4_init,
+        "extent": [round(value, 6) for value in extent],
+        "size": list(size),
+        "dpi": dpi,
+        "features": features,
+        "cartopy": cartopy.__version__,
+    }, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+def render_map_background(projection, extent, size, dpi, features=MAP_FEATURES):
+    """
+    Draw the Natural Earth features on their own, on a transparent figure exactly
+    the size of the map axis, and return them as an RGBA image.
+    Args: as for map_background_key()
+    Returns:
+        numpy.ndarray: The image, with shape (height, width, 4)
+    """
+    # A Figure that is not created through pyplot is never shown or kept open
+    background_fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    FigureCanvasAgg(background_fig)
+    background_fig.patch.set_alpha(0)
+    ax = background_fig.add_axes([0, 0, 1, 1], projection=projection)
+    ax.set_extent(extent, crs=projection)
+    ax.set_axis_off()
+    for name, style in features:
+        ax.add_feature(getattr(cfeature, name), zorder=0, **style)
+    background_fig.canvas.draw()
+    return np.asarray(background_fig.canvas.buffer_rgba()).copy()
+
+
+def add_map_background(ax, dpi, features=MAP_FEATURES, cache_dir=BACKGROUND_CACHE_DIR):
+    """
+    Add the Natural Earth features to a cartopy map axis as a single image, which is
+    read from the on-disk cache if it has been drawn before at the same projection,
+    extent, size and DPI, and drawn and saved to the cache otherwise. Call this once
+    the figure's layout is final, so that the image matches the axis pixel for pixel.
+    Args:
+        ax (cartopy.mpl.geoaxes.GeoAxes): The map axis, with its extent already set
+        dpi (int): Resolution the figure will be saved at
+        features (list): (name, style) pairs for the Natural Earth features
+        cache_dir (str): Directory of cached backgrounds
+    Returns:
+        matplotlib.image.AxesImage: The background image
+    """
+    # The axis only takes its final, fixed-aspect shape once apply_aspect() runs
+    ax.apply_aspect()
+    box = ax.get_position()
+    fig_width, fig_height = ax.figure.get_size_inches()
+    size = (max(1, round(box.width * fig_width * dpi)), max(1, round(box.height * fig_height * dpi)))
+    projection = ax.projection
+    extent = ax.get_extent()
+
+    key = map_background_key(projection, extent, size, dpi, features)
+    path = os.path.join(cache_dir, f"background_{key}.png")
+    if os.path.exists(path):
+        image = plt.imread(path)
+    else:
+        image = render_map_background(projection, extent, size, dpi, features)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file and rename it, so that another process rendering
+        # frames at the same time never reads a half-written image
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        plt.imsave(temp_path, image, format="png")
+        os.replace(temp_path, path)
+
+    return ax.imshow(image, extent=extent, transform=projection, origin="upper",
+                     interpolation="nearest", zorder=0)
+
+
+# Width of the widest flow bar, in degrees
+MAX_BAR_WIDTH = 0.8
+
+
+def parse_date(date, year=1812):
+    """Convert a date such as "Sept 14" to a datetime in the given year."""
+    month, day = date.split()
+    return datetime.strptime(f"{month[:3]} {day} {year}", "%b %d %Y")
+
+
+def waypoint_days(route, dates):
+    """
+    Work out the day of the campaign at which Napoleon reached each waypoint.
+    Waypoints with a date are fixed on the calendar; the others are placed between
+    the dated waypoints on either side in proportion to the distance travelled, as
+    if the army marched at a steady pace between them.
+    Args:
+        route (list): Waypoint dictionaries, in order of travel
+        dates (list): Date of each waypoint, such as "Sept 14", or None if unknown
+    Returns:
+        numpy.ndarray: Days since the first dated waypoint, one per waypoint
+    """
+    dated_indices = np.array([i for i, date in enumerate(dates) if date is not None])
+    if len(dated_indices) < 2:
+        raise ValueError("At least two waypoints need a date")
+
+    first = parse_date(dates[dated_indices[0]])
+    days = np.array([(parse_date(date) - first).days if date is not None else np.nan
+                     for date in dates])
+    distance = route_distances(route)
+
+    # The pair of dated waypoints around each waypoint (the first or last pair for
+    # waypoints outside the dated part of the route)
+    pair = np.searchsorted(dated_indices, np.arange(len(route)), side="right") - 1
+    pair = np.clip(pair, 0, len(dated_indices) - 2)
+    before, after = dated_indices[pair], dated_indices[pair + 1]
+
+    span = distance[after] - distance[before]
+    share = np.divide(distance - distance[before], span, out=np.zeros(len(route)), where=span > 0)
+    return np.where(np.isnan(days), days[before] + (days[after] - days[before]) * share, days)
+
+
+def route_distances(route):
+    """
+    Return the distance travelled to each waypoint along the route, in kilometres.
+    Each leg is measured on a local flat projection, which is accurate enough for
+    legs of a few hundred kilometres.
+    """
+    lons = np.radians([point["lon"] for point in route])
+    lats = np.radians([point["lat"] for point in route])
+    mid_lats = (lats[1:] + lats[:-1]) / 2
+    legs = np.hypot(np.diff(lons) * np.cos(mid_lats), np.diff(lats)) * 6371.0
+    return np.concatenate([[0.0], np.cumsum(legs)])
+
+
+def build_frame_schedule(total_frames, timing="dates"):
+    """
+    Work out, once, everything that changes from frame to frame of the animation,
+    so that drawing a frame is just a lookup in these arrays and any frame can be
+    drawn on its own. Napoleon's position is interpolated along the route either
+    on the real timeline ("dates", using the dates of the waypoints and of the
+    temperature readings, so that he waits in Moscow and hurries on the retreat)
+    or at constant speed ("distance").
+    Args:
+        total_frames (int): Number of frames
+        timing (str): "dates" or "distance"
+    Returns:
+        dict: Arrays with one entry per frame: lon, lat, segment (index of the
+              waypoint the current leg starts at), is_sad (Napoleon has reached
+              Moscow), troops and width (of the flow bar at that point, in degrees)
+    """
+    route = advance + retreat
+    if timing == "dates":
+        # The temperature readings on the retreat are dated too, so use their dates
+        # for retreat waypoints at the same longitude
+        temperature_dates = {t["lon"]: t["date"] for t in temperatures}
+        dates = ([point.get("date") for point in advance] +
+                 [point.get("date", temperature_dates.get(point["lon"])) for point in retreat])
+        clock = waypoint_days(route, dates)
+    elif timing == "distance":
+        clock = route_distances(route)
+    else:
+        raise ValueError(f"Unknown timing: {timing}")
+
+    lons = np.array([point["lon"] for point in route])
+    lats = np.array([point["lat"] for point in route])
+    troops = np.array([point["troops"] for point in route], dtype=float)
+
+    # Position of every frame on the clock, from the first waypoint to the last
+    frame_clock = np.linspace(clock[0], clock[-1], total_frames)
+    segment = np.clip(np.searchsorted(clock, frame_clock, side="right") - 1, 0, len(route) - 2)
+    # A leg with no duration (such as the stay in Moscow, or the retreat starting
+    # where the advance ended) is passed through at once
+    duration = clock[segment + 1] - clock[segment]
+    share = np.divide(frame_clock - clock[segment], duration,
+                      out=np.zeros(total_frames), where=duration > 0)
+    share = np.clip(share, 0, 1)
+
+    def interpolate(values):
+        return values[segment] + (values[segment + 1] - values[segment]) * share
+
     moscow_idx = len(advance) - 1
-    if segment_idx >= moscow_idx:
-        napoleon_at_moscow = True
-    
-    # Remove old patches
-    for patch in napoleon_patches:
-        try:
-            if patch in ax1.patches:
-                patch.remove()
-        except (ValueError, AttributeError):
-            pass
-    
-    # Clear the list
-    napoleon_patches = []
-    
-    # Draw Napoleon at new position with appropriate expression
+    frame_troops = interpolate(troops)
+    return {
+        "lon": interpolate(lons),
+        "lat": interpolate(lats),
+        "segment": segment,
+        "is_sad": frame_clock >= clock[moscow_idx],
+        "troops": frame_troops,
+        "width": frame_troops / troops.max() * MAX_BAR_WIDTH,
+    }
+
+
+# Number of animation frames - more frames make Napoleon move more slowly
+TOTAL_FRAMES = 400
+
+# How Napoleon moves along the route: "dates" follows the dates recorded on the map,
+# "distance" moves him at a constant speed
+ANIMATION_TIMING = "dates"
+
+# Position, mood and troop numbers for every frame, worked out once
+frame_schedule = build_frame_schedule(TOTAL_FRAMES, ANIMATION_TIMING)
+
+# The figure and its axes, created by build_figure()
+fig = ax1 = ax2 = None
+
+# The moving caricature, created by the first call to animate()
+napoleon_sprite = None
+
+
+def build_figure(verbose=True, dpi=300):
+    """
+    Build the static figure: the map with its flow bars, labels, battle markers and
+    rivers, and the temperature chart below it. The figure and axes are kept in the
+    module's fig, ax1 and ax2 variables, which animate() draws on.
+    Args:
+        verbose (bool): Print the bar width scale factor
+        dpi (int): Resolution of the cached map background, with cartopy
+    Returns:
+        matplotlib.figure.Figure: The figure
+    """
+    global fig, ax1, ax2, napoleon_sprite
+    napoleon_sprite = None
+
+    # Create figure with main map emphasised and minimal temperature chart
+    fig = plt.figure(figsize=(18, 12))
+    gs = fig.add_gridspec(10, 1, hspace=0.05)  # Reduced spacing to bring temperature graph closer
+
+    # Create main map axis with or without cartopy
     if HAS_CARTOPY:
-        napoleon_patches = draw_napoleon_caricature(
-            ax1, napoleon_x, napoleon_y, size=1.0, 
-            is_sad=napoleon_at_moscow, transform=ccrs.PlateCarree()
-        )
+        ax1 = fig.add_subplot(gs[0:9, 0], projection=ccrs.PlateCarree())
     else:
-        napoleon_patches = draw_napoleon_caricature(
-            ax1, napoleon_x, napoleon_y, size=1.0, is_sad=napoleon_at_moscow
+        ax1 = fig.add_subplot(gs[0:9, 0])  # Main map - takes 9/10 of space
+
+    ax2 = fig.add_subplot(gs[9, 0])   # Temperature - minimal, takes 1/10
+
+    # Extract coordinates and troop numbers
+    advance_lons = [p["lon"] for p in advance]
+    advance_lats = [p["lat"] for p in advance]
+    advance_troops = [p["troops"] for p in advance]
+
+    retreat_lons = [p["lon"] for p in retreat]
+    retreat_lats = [p["lat"] for p in retreat]
+    retreat_troops = [p["troops"] for p in retreat]
+
+    # Scale factor for width (troops to visual width in degrees)
+    # The coordinate system spans ~13.6 degrees longitude and ~1.9 degrees latitude
+    # Increased width to make bars chunkier and more visible
+    max_troops = max(max(advance_troops), max(retreat_troops))
+    desired_max_width = MAX_BAR_WIDTH  # degrees - increased from 0.25 for chunkier bars
+    scale_factor = desired_max_width / max_troops
+
+    if verbose:
+        print(f"Scale factor: {scale_factor:.2e}")
+        print(f"Max troops: {max_troops:,}")
+        print(f"Max bar width: {max_troops * scale_factor:.4f} degrees")
+
+    # Draw advance and retreat paths as continuous bars, with mitred joins between the trapezoids
+    render_flow_map([advance_path, retreat_path], widths=desired_max_width,
+                    colors=["#d4a574", "#2c3e50"],
+                    labels=["Advance to Moscow", "Retreat from Moscow"], ax=ax1)
+
+    # Add annotations for all locations with leader lines
+    all_points = advance + retreat
+    seen_locations = set()
+
+    for point in all_points:
+        loc_key = (point["lon"], point["lat"])
+        if loc_key in seen_locations:
+            continue
+        seen_locations.add(loc_key)
+        
+        # Extract location name
+        name_parts = point["name"].split("(")
+        city_name = name_parts[0].strip()
+        country = name_parts[1].strip(")") if len(name_parts) > 1 else ""
+        
+        # Build label without coordinates (remove battle info from text - shown as marker)
+        label_parts = [city_name]
+        if country:
+            label_parts.append(f"({country})")
+        if "date" in point:
+            label_parts.append(point["date"])
+        # Battle info removed - will be shown as marker at location with label
+        
+        label = "\n".join(label_parts)
+        
+        # Position annotation offset based on location (further away to avoid covering plot)
+        offset_x = 50 if point["lon"] < 30 else -50
+        offset_y = 50 if point["lat"] < 55 else -50
+        
+        # No background or border for annotations
+        ax1.annotate(
+            label,
+            (point["lon"], point["lat"]),
+            xytext=(offset_x, offset_y),
+            textcoords="offset points",
+            fontsize=9,
+            bbox=None,  # No box
+            zorder=5,
+            ha="left" if offset_x > 0 else "right",
+            color="red" if point.get("battle", False) else "black",
+            weight="bold" if point.get("battle", False) else "normal"
         )
-    
-    return napoleon_patches
+        
+        # Add leader line from annotation to location
+        # Draw a line from the location to near the annotation
+        line_end_x = point["lon"] + offset_x * 0.4
+        line_end_y = point["lat"] + offset_y * 0.4
+        
+        if HAS_CARTOPY:
+            # For cartopy, we need to use transform
+            ax1.plot(
+                [point["lon"], line_end_x],
+                [point["lat"], line_end_y],
+                color="gray",
+                linestyle="--",
+                linewidth=0.8,
+                alpha=0.6,
+                transform=ccrs.PlateCarree(),
+                zorder=3
+            )
+        else:
+            ax1.plot(
+                [point["lon"], line_end_x],
+                [point["lat"], line_end_y],
+                color="gray",
+                linestyle="--",
+                linewidth=0.8,
+                alpha=0.6,
+                zorder=3
+            )
 
-# Create animation - slower
-anim = FuncAnimation(fig, animate, frames=400, interval=50, blit=False, repeat=True)
+    # Draw battle markers at exact battle locations with labels
+    for point in all_points:
+        if point.get("battle", False) and "battle_name" in point:
+            battle_name = point["battle_name"]
+            if HAS_CARTOPY:
+                draw_battle_marker(ax1, point["lon"], point["lat"], 
+                                 battle_name=battle_name, transform=ccrs.PlateCarree())
+            else:
+                draw_battle_marker(ax1, point["lon"], point["lat"], battle_name=battle_name)
 
-# Save animation as GIF
-print("Saving animation (this may take a while)...")
-try:
-    # Try using imageio for better GIF support if available
-    try:
-        import imageio
-        from io import BytesIO
-        print("Using imageio for GIF creation...")
+    # Set axis limits with some padding
+    all_lons = advance_lons + retreat_lons
+    all_lats = advance_lats + retreat_lats
+    lon_min, lon_max = min(all_lons), max(all_lons)
+    lat_min, lat_max = min(all_lats), max(all_lats)
+
+    # Add padding
+    lon_padding = (lon_max - lon_min) * 0.15
+    lat_padding = (lat_max - lat_min) * 0.15
+
+    # Calculate the top and bottom plot edges, where the rivers start and end
+    plot_lat_min = lat_min - lat_padding
+    plot_lat_max = lat_max + lat_padding
+
+    # Define the three major rivers with extended paths to plot edges
+    # 1. Niemen/Neman River (flows from south to north, crossed at Kowno ~24.0°E, 54.9°N)
+    niemen_river = [
+        (24.0, plot_lat_min),  # Start at southern edge
+        (23.8, 54.2),
+        (23.9, 54.5),
+        (24.0, 54.7),
+        (24.0, 54.9),  # Kowno crossing point
+        (24.1, 55.1),
+        (24.2, 55.3),
+        (24.3, 55.5),
+        (24.4, plot_lat_max),  # Extend to northern edge
+    ]
+
+    # 2. Dnieper River (flows from north to south, through the region)
+    dnieper_river = [
+        (30.5, plot_lat_max),  # Start at northern edge
+        (30.4, 55.8),
+        (30.3, 55.6),
+        (30.2, 55.4),
+        (30.2, 55.2),  # Near Vitebsk
+        (30.3, 55.0),
+        (30.5, 54.8),
+        (31.0, 54.6),  # Near Smolensk
+        (31.5, 54.4),
+        (32.0, 54.2),
+        (32.5, 54.0),
+        (33.0, 53.8),
+        (33.2, plot_lat_min),  # Extend to southern edge
+    ]
+
+    # 3. Berezina River (flows from north to south, famous crossing at Studenka ~30.0°E, 54.4°N)
+    berezina_river = [
+        (29.5, plot_lat_max),  # Start at northern edge
+        (29.4, 55.5),
+        (29.3, 55.2),
+        (29.2, 54.9),
+        (29.3, 54.6),
+        (29.5, 54.4),  # Near Studenka crossing
+        (29.7, 54.2),
+        (29.9, 54.0),
+        (30.0, 53.8),
+        (30.1, plot_lat_min),  # Extend to southern edge
+    ]
+
+    # Add background map
+    if HAS_CARTOPY:
+        # Set map extent
+        ax1.set_extent([lon_min - lon_padding, lon_max + lon_padding,
+                        lat_min - lat_padding, lat_max + lat_padding],
+                       crs=ccrs.PlateCarree())
+
+        # The map features (MAP_FEATURES) are added as a cached image once the layout is final
         
-        # Render frames to a list
-        frames = []
-        for i in range(400):
-            animate(i)
-            fig.canvas.draw()
-            # Save frame to buffer
-            buf = BytesIO()
-            fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-            buf.seek(0)
-            # Read image using imageio (try v2 API first, fallback to v1)
-            try:
-                frame = imageio.v2.imread(buf)
-            except AttributeError:
-                frame = imageio.imread(buf)
-            frames.append(frame)
-            if (i + 1) % 50 == 0:
-                print(f"Rendered {i + 1}/400 frames...")
+        # Draw the three major rivers manually (more visible)
+        niemen_lons, niemen_lats = zip(*niemen_river)
+        dnieper_lons, dnieper_lats = zip(*dnieper_river)
+        berezina_lons, berezina_lats = zip(*berezina_river)
         
-        # Save as animated GIF (try v2 API first, fallback to v1)
-        try:
-            imageio.v2.mimsave("minard_animation.gif", frames, fps=10, loop=0)
-        except AttributeError:
-            imageio.mimsave("minard_animation.gif", frames, fps=10, loop=0)
-        print("Animation saved as minard_animation.gif using imageio")
-    except ImportError:
-        # Fallback to pillow writer with explicit frame rendering
-        print("imageio not available, using pillow writer...")
-        # Use 'pillow' writer for GIF - ensure frames are properly rendered
-        from matplotlib.animation import PillowWriter
-        writer = PillowWriter(fps=10)
-        anim.save("minard_animation.gif", writer=writer, dpi=100)
-        print("Animation saved as minard_animation.gif using pillow")
+        ax1.plot(niemen_lons, niemen_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Niemen River", transform=ccrs.PlateCarree(), zorder=1)
+        ax1.plot(dnieper_lons, dnieper_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Dnieper River", transform=ccrs.PlateCarree(), zorder=1)
+        ax1.plot(berezina_lons, berezina_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Berezina River", transform=ccrs.PlateCarree(), zorder=1)
+        
+        # Add river labels (no background or border)
+        ax1.text(24.2, 54.6, "Niemen", fontsize=9, color="#2c5aa0", 
+                 weight="bold", transform=ccrs.PlateCarree(), zorder=2)
+        ax1.text(31.5, 54.3, "Dnieper", fontsize=9, color="#2c5aa0", 
+                 weight="bold", transform=ccrs.PlateCarree(), zorder=2)
+        ax1.text(29.5, 54.0, "Berezina", fontsize=9, color="#2c5aa0", 
+                 weight="bold", transform=ccrs.PlateCarree(), zorder=2)
         
-except Exception as e:
-    print(f"Error saving animation: {e}")
-    import traceback
-    traceback.print_exc()
-    print("\nTrying to show animation in window instead...")
-    # Show the plot with animation
-    plt.show()
-else:
-    # If save succeeded, optionally show the plot
-    print("Animation saved successfully!")
-    print("You can also view it by running: python plot_minard.py")
-    # Uncomment the line below if you want to show the plot after saving
-    # plt.show()
+        ax1.gridlines(draw_labels=False, linewidth=0.5, alpha=0.3, linestyle="--", zorder=1)
+    else:
+        # Simple background without cartopy
+        ax1.set_xlim(lon_min - lon_padding, lon_max + lon_padding)
+        ax1.set_ylim(lat_min - lat_padding, lat_max + lat_padding)
+        ax1.set_aspect("equal", adjustable="box")
+        ax1.set_facecolor("#f5f5dc")  # Light beige background
+        
+        # Draw the three major rivers manually
+        niemen_lons, niemen_lats = zip(*niemen_river)
+        dnieper_lons, dnieper_lats = zip(*dnieper_river)
+        berezina_lons, berezina_lats = zip(*berezina_river)
+        
+        ax1.plot(niemen_lons, niemen_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Niemen River", zorder=1)
+        ax1.plot(dnieper_lons, dnieper_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Dnieper River", zorder=1)
+        ax1.plot(berezina_lons, berezina_lats, color="#4a90e2", linewidth=2.5, 
+                 alpha=0.7, label="Berezina River", zorder=1)
+        
+        # Add river labels (no background or border)
+        ax1.text(24.2, 54.6, "Niemen", fontsize=9, color="#2c5aa0", 
+                 weight="bold", zorder=2)
+        ax1.text(31.5, 54.3, "Dnieper", fontsize=9, color="#2c5aa0", 
+                 weight="bold", zorder=2)
+        ax1.text(29.5, 54.0, "Berezina", fontsize=9, color="#2c5aa0", 
+                 weight="bold", zorder=2)
+        
+        ax1.grid(True, alpha=0.2, linestyle="--", linewidth=0.5, zorder=0)
+
+    # Remove axis labels (no lat/lon on axes)
+    ax1.set_xlabel("", fontsize=14)
+    ax1.set_ylabel("", fontsize=14)
+    ax1.set_title(
+        "Minard's Map of Napoleon's Russian Campaign, 1812\n"
+        "Bar width represents number of soldiers (perpendicular to direction of travel)",
+        fontsize=16,
+        fontweight="bold",
+        pad=20
+    )
+
+    # Minimal temperature plot
+    temp_lons = [t["lon"] for t in temperatures]
+    temp_temps = [t["temp"] for t in temperatures]
+
+    ax2.plot(temp_lons, temp_temps, "-", color="#1976d2", linewidth=1.5, markersize=3)
+    ax2.fill_between(temp_lons, temp_temps, 0, alpha=0.2, color="#1976d2")
+    ax2.set_xlabel("", fontsize=9)
+    ax2.set_ylabel("Temp (°C)", fontsize=9)
+    ax2.tick_params(labelsize=8)
+    ax2.grid(True, alpha=0.2, linestyle="--", linewidth=0.5)
+    ax2.axhline(y=0, color="k", linestyle="-", linewidth=0.5)
+    ax2.set_ylim(-35, 5)
+
+    # Adjust layout - move temperature graph closer to map
+    fig.tight_layout()
+    fig.subplots_adjust(hspace=0.05)  # Reduce vertical spacing between subplots
+
+    if HAS_CARTOPY:
+        add_map_background(ax1, dpi)
+
+    return fig
+
+
+def animate(frame):
+    """Animate Napoleon moving along the route, looking his position up in frame_schedule"""
+    global napoleon_sprite
+    
+    # Everything depends only on the frame number, so frames can be rendered in any
+    # order, or in separate processes
+    napoleon_x = frame_schedule["lon"][frame]
+    napoleon_y = frame_schedule["lat"][frame]
+    napoleon_at_moscow = frame_schedule["is_sad"][frame]
+    
+    # Draw the caricature once, then only move it to each new position
+    if napoleon_sprite is None:
+        if HAS_CARTOPY:
+            napoleon_sprite = NapoleonSprite(ax1, size=1.0, transform=ccrs.PlateCarree())
+        else:
+            napoleon_sprite = NapoleonSprite(ax1, size=1.0)
+    
+    # Show Napoleon at the new position with the appropriate expression
+    return napoleon_sprite.move(napoleon_x, napoleon_y, is_sad=napoleon_at_moscow)
+
+
+def prepare_canvas(dpi=100, mode="blit"):
+    """
+    Draw the figure, without the caricature, ready for render_frame().
+    The caricature's patches are animated artists, so they are not part of the drawing.
+    See flow_map.prepare_canvas() for the arguments and return value.
+    """
+    return flow_map.prepare_canvas(fig, dpi, mode)
+
+
+def render_frame(frame, background, rows, columns):
+    """
+    Render one animation frame and return it as an RGBA array (a view of the canvas
+    that is only valid until the next frame is rendered). With a background, only
+    the caricature is drawn over the cached map; otherwise the whole figure is redrawn.
+    """
+    return flow_map.render_frame(fig, animate, frame, background, rows, columns)
+
+
+def render_frames(frames=range(TOTAL_FRAMES), dpi=100, mode="blit"):
+    """
+    Render animation frames in this process, yielding each one as an RGBA array.
+    In "blit" mode the static background (map, flow bars, labels and temperature
+    chart) is drawn once and cached; each frame restores that cached image and draws
+    only the caricature's patches on top of it. In "full" mode the whole figure is
+    redrawn for every frame. As with render_frame(), each array is a view of the
+    canvas that is only valid until the next frame is rendered.
+    Args:
+        frames (iterable): Frame numbers to render
+        dpi (int): Resolution of the frames
+        mode (str): "blit" or "full"
+    Yields:
+        numpy.ndarray: Each frame, cropped to the figure's tight bounding box
+    """
+    original_dpi = fig.dpi
+    try:
+        background, rows, columns = prepare_canvas(dpi, mode)
+        for frame in frames:
+            yield render_frame(frame, background, rows, columns)
+    finally:
+        fig.set_dpi(original_dpi)
+
+
+# Canvas of a parallel rendering worker process, set up by _start_render_worker()
+_worker_canvas = None
+
+
+def _start_render_worker(dpi, mode):
+    """Build this worker process's own figure, and draw its background, once."""
+    global _worker_canvas
+    plt.switch_backend("Agg")
+    build_figure(verbose=False, dpi=dpi)
+    _worker_canvas = prepare_canvas(dpi, mode)
+
+
+def _render_frame_range(start, stop):
+    """Render frames start to stop - 1 in a worker process, as RGB arrays."""
+    # Copy each frame out of the canvas, leaving out the alpha channel to send less data back
+    return [render_frame(frame, *_worker_canvas)[..., :3].copy() for frame in range(start, stop)]
+
+
+def render_frames_parallel(total_frames=TOTAL_FRAMES, dpi=100, mode="blit", workers=None,
+                           chunk_size=10):
+    """
+    Render the animation frames in a pool of processes, yielding them in frame order.
+    Each frame depends only on its frame number, so ranges of chunk_size frames are
+    shared out between the workers. Every worker builds its own copy of the figure
+    once and sends back the frames as RGB arrays, which are yielded in order so that
+    a single writer can encode them. At most two ranges per worker are in progress or
+    waiting to be written at any time, which keeps memory use bounded.
+    Args:
+        total_frames (int): Number of frames to render
+        dpi (int): Resolution of the frames
+        mode (str): "blit" or "full"
+        workers (int): Number of worker processes (defaults to the number of CPUs)
+        chunk_size (int): Number of frames rendered by a worker at a time
+    Yields:
+        numpy.ndarray: Each frame
+    """
+    workers = workers or os.cpu_count() or 1
+    starts = iter(range(0, total_frames, chunk_size))
+    pending = deque()
+
+    # "spawn" starts clean worker processes on every platform, without copying this
+    # process's figure or GUI state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_render_worker,
+                             initargs=(dpi, mode)) as pool:
+
+        def submit_next():
+            start = next(starts, None)
+            if start is not None:
+                stop = min(start + chunk_size, total_frames)
+                pending.append(pool.submit(_render_frame_range, start, stop))
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+            while pending:
+                frames = pending.popleft().result()
+                submit_next()
+                yield from frames
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# "blit" draws the static background once and only redraws the caricature for each
+# frame; "full" redraws the whole figure for every frame (much slower)
+RENDER_MODE = "blit"
+
+# Output file for the animation: .gif, .mp4, .webm, .webp or .apng
+ANIMATION_FILE = "minard_animation.gif"
+
+# Quality of the video and WebP/APNG formats: "high", "balanced" or "small"
+ANIMATION_PRESET = "balanced"
+
+# Number of processes rendering frames at once; with 1, frames are rendered in this process.
+# None uses every core for "full" mode, where each frame is slow to draw, and 1 for "blit"
+# mode, where starting the workers costs more than it saves
+RENDER_WORKERS = None
+
+
+def main():
+    """Draw and save the static map, then render and save the animation."""
+    build_figure(dpi=300)
+
+    # Save static plot
+    plt.savefig("minard_plot.png", dpi=300, bbox_inches="tight")
+    print("Static plot saved as minard_plot.png")
+
+    # Create animation
+    print("Creating animation...")
+
+    # Save animation
+    print("Saving animation (this may take a while)...")
+    workers = RENDER_WORKERS
+    if workers is None:
+        workers = (os.cpu_count() or 1) if RENDER_MODE == "full" else 1
+    try:
+        if workers > 1:
+            print(f"Rendering frames in {workers} processes...")
+            frames = render_frames_parallel(TOTAL_FRAMES, dpi=100, mode=RENDER_MODE,
+                                            workers=workers)
+        else:
+            frames = render_frames(range(TOTAL_FRAMES), dpi=100, mode=RENDER_MODE)
+
+        # Stream each frame to the file as soon as it is rendered
+        with FrameWriter(ANIMATION_FILE, fps=10, preset=ANIMATION_PRESET) as writer:
+            for i, frame in enumerate(frames):
+                writer.write(frame)
+                if (i + 1) % 50 == 0:
+                    print(f"Rendered {i + 1}/{TOTAL_FRAMES} frames...")
+        print(f"Animation saved as {ANIMATION_FILE}")
+
+    except Exception as e:
+        print(f"Error saving animation: {e}")
+        import traceback
+        traceback.print_exc()
+        print("\nTrying to show animation in window instead...")
+        # Show the plot with animation
+        plt.show()
+    else:
+        # If save succeeded, optionally show the plot
+        print("Animation saved successfully!")
+        print("You can also view it by running: python plot_minard.py")
+        # Uncomment the line below if you want to show the plot after saving
+        # plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+access-mongo-async.py
+
+An asyncio version of access-mongo.py, for use inside services that already run an
+event loop (for example one that also polls the environmental HTTP APIs used in
+Colab/EnvironmentalAPI.ipynb). It demonstrates how to:
+- Connect to MongoDB with an asynchronous driver (PyMongo's AsyncMongoClient, or Motor
+  with older versions of PyMongo)
+- Load the noise mapping CSV file with several insert_many batches in flight at once
+- Stream the results of a prefix query as an async iterator instead of printing them
+- Run loads and queries concurrently on a single event loop, without a thread per job
+
+The CSV parsing, type conversion and index/query helpers are shared with access-mongo.py,
+so both scripts load and query the data in exactly the same way.
+
+Author: S.Hallett
+Course: MKU, Big Data and Visualisation
+Date: 18/06/2025
+"""
+
+import asyncio
+import importlib.util
+import inspect
+import os
+import time
+
+# PyMongo 4.10+ includes an asyncio client; fall back to Motor for older versions
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+
+# access-mongo.py cannot be imported with a normal import statement because of the
+# hyphen in its name, so load it from the same directory by path
+_spec = importlib.util.spec_from_file_location(
+    "access_mongo", os.path.join(os.path.dirname(os.path.abspath(__file__)), "access-mongo.py"))
+access_mongo = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(access_mongo)
+
+# The process-wide asynchronous client created by connect()
+_client = None
+_client_lock = asyncio.Lock()
+
+
+async def connect(uri=None, max_pool_size=100):
+    """
+    Return the database and collection objects, using a shared asynchronous client.
+    The client is created (and pinged) on the first call only; later calls, from any
+    task on the event loop, reuse its connection pool.
+    Args:
+        uri (str): Connection string (defaults to the MONGODB_URI environment variable,
+                   or the local server)
+        max_pool_size (int): Maximum number of pooled connections
+    Returns:
+        tuple: (database, collection)
+    """
+    global _client
+    async with _client_lock:
+        if _client is None:
+            client = AsyncMongoClient(uri or access_mongo.MONGODB_URI,
+                                      maxPoolSize=max_pool_size,
+                                      serverSelectionTimeoutMS=2000)
+            await client.admin.command('ping')
+            print("Successfully connected to MongoDB!")
+            _client = client
+
+    db = _client[access_mongo.DATABASE_NAME]
+    return db, db[access_mongo.COLLECTION_NAME]
+
+
+async def close():
+    """Close the shared asynchronous client, if one is open."""
+    global _client
+    if _client is not None:
+        result = _client.close()
+        # AsyncMongoClient.close() is a coroutine; Motor's close() is not
+        if inspect.isawaitable(result):
+            await result
+        _client = None
+
+
+async def ensure_indexes(collection):
+    """Asynchronous version of access_mongo.ensure_indexes()."""
+    names = []
+    for field in access_mongo.PREFIX_SEARCH_FIELDS:
+        lower_field = field + access_mongo.LOWERCASE_SUFFIX
+        await collection.update_many({lower_field: {"$exists": False}, field: {"$type": "string"}},
+                                     [{"$set": {lower_field: {"$toLower": "$" + field}}}])
+        names.append(await collection.create_index([(lower_field, 1), (field, 1)]))
+    print(f"Indexes ready on {collection.name}: {', '.join(names)}")
+    return names
+
+
+async def load_csv(csv_file_path=None, collection=None, batch_size=5000,
+                   max_batch_bytes=8 * 1024 * 1024, max_in_flight=4, schema=None, sample_rows=1000):
+    """
+    Load data from a CSV file into the MongoDB collection without blocking the event loop.
+    Reading and converting each chunk of rows runs in a worker thread, while up to
+    max_in_flight insert_many calls wait on the network at once. As in access-mongo.py,
+    the data goes into a shadow collection which is swapped in with renameCollection
+    once it is complete, so concurrent queries keep seeing the previous data until then.
+    Args:
+        csv_file_path (str): Path to the CSV file (defaults to data/noise_mapping_round_3.csv)
+        collection: Target collection (defaults to the noise_mapping collection)
+        batch_size (int): Maximum number of documents per insert_many call
+        max_batch_bytes (int): Maximum encoded BSON size of each insert_many call
+        max_in_flight (int): Maximum number of concurrent insert_many calls
+        schema (dict): Column types (inferred from the first sample_rows rows if not given)
+        sample_rows (int): Number of rows sampled to infer the schema
+    Returns:
+        dict: Load statistics (rows, batches, seconds, rows_per_second, batch_latencies)
+    """
+    if collection is None:
+        db, collection = await connect()
+
+    if csv_file_path is None:
+        csv_file_path = os.path.join('data', 'noise_mapping_round_3.csv')
+
+    if not os.path.exists(csv_file_path):
+        raise FileNotFoundError(f"CSV file not found at: {csv_file_path}")
+
+    shadow = collection.database[collection.name + access_mongo.SHADOW_SUFFIX]
+    await shadow.drop()
+    print(f"Loading into shadow collection {shadow.name} "
+          f"({collection.name} stays available while loading)...")
+
+    start = time.perf_counter()
+    if schema is None:
+        schema = await asyncio.to_thread(access_mongo.infer_schema, csv_file_path, sample_rows)
+        access_mongo.print_schema(schema)
+
+    slots = asyncio.Semaphore(max_in_flight)
+    batch_latencies = []
+    inserts = []
+
+    async def insert(batch):
+        try:
+            batch_start = time.perf_counter()
+            result = await shadow.insert_many(batch, ordered=False)
+            batch_latencies.append(time.perf_counter() - batch_start)
+            return len(result.inserted_ids)
+        finally:
+            slots.release()
+
+    try:
+        chunks = access_mongo.iter_csv_chunks(csv_file_path, batch_size)
+        while True:
+            # Reading from disk and converting are blocking, so do them off the event loop
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            header, rows = chunk
+            docs = await asyncio.to_thread(access_mongo.build_documents, header, rows, schema)
+            for batch in access_mongo.split_by_bson_size(docs, max_batch_bytes):
+                # Wait for a free slot, so that at most max_in_flight batches are held in memory
+                await slots.acquire()
+                inserts.append(asyncio.create_task(insert(batch)))
+
+        total_rows = sum(await asyncio.gather(*inserts))
+    except BaseException:
+        for task in inserts:
+            task.cancel()
+        # Wait for the cancelled inserts to finish before dropping the collection they write to
+        # (this also retrieves their exceptions)
+        await asyncio.gather(*inserts, return_exceptions=True)
+        await shadow.drop()
+        raise
+
+    await ensure_indexes(shadow)
+    await shadow.rename(collection.name, dropTarget=True)
+
+    elapsed = time.perf_counter() - start
+    rows_per_second = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"Inserted {total_rows:,} documents into {collection.name} "
+          f"in {elapsed:.2f}s ({rows_per_second:,.0f} rows/s).")
+
+    return {
+        "rows": total_rows,
+        "batches": len(batch_latencies),
+        "seconds": elapsed,
+        "rows_per_second": rows_per_second,
+        "batch_latencies": batch_latencies,
+    }
+
+
+async def query_prefix(field, prefix, projection=None, collection=None, batch_size=1000):
+    """
+    Stream the documents whose field starts with a prefix (case-insensitively).
+    This is an async generator, so callers consume the results as they arrive:
+        async for doc in query_prefix("Location/Agglomeration", "M"):
+            ...
+    Args:
+        field (str): One of access_mongo.PREFIX_SEARCH_FIELDS
+        prefix (str): The prefix to match, in any case
+        projection (dict): Fields to return for each document (None for whole documents)
+        collection: The collection to query (defaults to the noise_mapping collection)
+        batch_size (int): Number of documents fetched from the server per round-trip
+    Yields:
+        dict: Each matching document
+    """
+    if collection is None:
+        db, collection = await connect()
+
+    query_filter = access_mongo.prefix_filter(field, prefix)
+    async for doc in collection.find(query_filter, projection, batch_size=batch_size):
+        yield doc
+
+
+async def count_prefix(field, prefix, collection=None):
+    """Count the documents whose field starts with a prefix (counted on the server)."""
+    if collection is None:
+        db, collection = await connect()
+    return await collection.count_documents(access_mongo.prefix_filter(field, prefix))
+
+
+async def main():
+    """
+    Load the CSV file and, at the same time, run prefix queries for several letters.
+    Everything runs concurrently as tasks on one event loop, so each count may see
+    either the previously loaded data or the new data, depending on whether the load
+    had swapped the new collection in by then.
+    """
+    try:
+        db, collection = await connect()
+    except Exception as e:
+        print(f"Could not connect to MongoDB: {str(e)}")
+        return
+
+    try:
+        letters = ["B", "L", "M"]
+        load = load_csv(collection=collection)
+        queries = [count_prefix("Location/Agglomeration", letter, collection) for letter in letters]
+        results = await asyncio.gather(load, *queries, return_exceptions=True)
+
+        if isinstance(results[0], Exception):
+            print(f"Error loading CSV data: {str(results[0])}")
+        for letter, count in zip(letters, results[1:]):
+            if isinstance(count, Exception):
+                print(f"Error querying '{letter}': {str(count)}")
+            else:
+                print(f"Documents starting with '{letter}' (counted while the load was running): {count}")
+
+        # Stream the 'M' matches from the newly loaded data
+        print("Documents where 'Location/Agglomeration' starts with 'M':")
+        async for doc in query_prefix("Location/Agglomeration", "M",
+                                      {"Location/Agglomeration": 1, "_id": 0}, collection):
+            print(doc)
+    finally:
+        await close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,10 +3,17 @@
 access-mongo.py
 
 This script demonstrates how to:
-- Connect to a local MongoDB database using Python and pymongo
-- Load data from a CSV file into a MongoDB collection (deleting any existing data first)
-- Query the collection for documents where a specific field starts with a given letter
-- Display the structure and contents of documents in a readable format
+- Connect to a local MongoDB database using Python and pymongo, sharing one pooled client
+- Load data from a CSV file into a MongoDB collection, streaming the file in batches so that
+  large files do not need to fit in memory, and swapping the new data in only once it is complete
+- Alternatively, update the collection incrementally with only the rows that changed
+- Optionally run the load as a pipeline of parallel conversion workers and writer threads
+- Infer a type for each column (integer, float, date or string) from a sample of rows,
+  so that numeric fields are stored as numbers and can be queried with ranges
+- Index the collection and query it for documents where a specific field starts with a given
+  letter, checking that the query uses the index rather than scanning every document
+- Display the contents of documents in a readable format, or stream them
+  to a file as NDJSON, CSV, Parquet or BSON
 
 This example is designed for students learning about Python, MongoDB, and data handling. 
 It uses the 'pymongo' library for MongoDB access and the built-in 'csv' module for CSV handling. 
@@ -16,30 +23,157 @@ Course: MKU, Big Data and Visualisation
 Date: 18/06/2025
 """
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, InsertOne, ReplaceOne, DeleteMany
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from bson import json_util, ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+import argparse
+import atexit
+import bson
 import pprint
 import csv
+import hashlib
+import importlib.util
+import json
 import os
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+
+# Connection details; set the MONGODB_URI environment variable to use another server
+MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
+DATABASE_NAME = 'environmental'
+COLLECTION_NAME = 'noise_mapping'
+
+# The process-wide client created by get_client()
+_client = None
+_client_lock = threading.Lock()
+
+# Decode BSON lazily: RawBSONDocument only parses a field when it is accessed
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# Raw values that are loaded as None (compared case-insensitively, ignoring whitespace)
+NULL_SENTINELS = {'', 'n/a', 'na', 'null', 'none', '-'}
+
+# Date formats recognised when inferring column types
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+# Numbers with thousands separators, such as '1,234' or '-12,345.67'
+GROUPED_NUMBER = re.compile(r'^[+-]?\d{1,3}(,\d{3})+(\.\d*)?$')
+
+# Range of the BSON int64 type; larger integers cannot be stored as integers
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+# Full reloads are written to '<collection>_shadow' and then renamed over the live collection
+SHADOW_SUFFIX = '_shadow'
+
+# Fields searched by prefix. Each gets a lower-case copy ('<field>_lower') at load time,
+# indexed together with the original field so that case-insensitive prefix queries become
+# index range scans that are also covered by the index
+PREFIX_SEARCH_FIELDS = ('Location/Agglomeration',)
+LOWERCASE_SUFFIX = '_lower'
+
+
+class QueryPlanError(RuntimeError):
+    """Raised when a query that should use an index would scan the whole collection."""
+
+
+def _available_compressors():
+    """Return the wire compressors that can be used here, in order of preference."""
+    compressors = []
+    # zstd and snappy need optional packages; zlib is always available
+    for name, module in (('zstd', 'zstandard'), ('snappy', 'snappy')):
+        if importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+    compressors.append('zlib')
+    return compressors
+
+
+def get_client(uri=None, max_pool_size=100, min_pool_size=0, compressors=None):
+    """
+    Return the process-wide MongoClient, creating it on first use.
+    A MongoClient holds a pool of connections and is safe to share between threads,
+    so one client is created per process and reused by every function here. Connection
+    set-up (and the TLS handshake for a remote server) and the 'ping' check therefore
+    happen only once, not on every call. The options only take effect when the client
+    is first created; call close_client() first to recreate it with different ones.
+    From asyncio code, run blocking calls on this client with asyncio.to_thread().
+    Args:
+        uri (str): Connection string (defaults to the MONGODB_URI environment variable,
+                   or the local server)
+        max_pool_size (int): Maximum number of pooled connections
+        min_pool_size (int): Number of connections kept open while idle
+        compressors (list): Wire compressors to offer, e.g. ['zstd', 'snappy'] (defaults
+                            to every compressor available here)
+    Returns:
+        MongoClient: The shared client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            # Check again now that we hold the lock, in case another thread got here first
+            if _client is None:
+                client = MongoClient(uri or MONGODB_URI,
+                                     maxPoolSize=max_pool_size,
+                                     minPoolSize=min_pool_size,
+                                     compressors=compressors or _available_compressors(),
+                                     serverSelectionTimeoutMS=2000)
+                try:
+                    # Test the connection by sending a ping command (once, when the client is created)
+                    client.admin.command('ping')
+                except Exception:
+                    client.close()
+                    raise
+                print("Successfully connected to MongoDB!")
+                _client = client
+                atexit.register(close_client)
+    return _client
+
+
+def close_client():
+    """Close the process-wide MongoClient and its pooled connections, if one is open."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+@contextmanager
+def mongo_session(causal_consistency=True):
+    """
+    Context manager giving a session on the shared client, ended automatically on exit.
+    Sessions group operations for causal consistency or transactions, e.g.
+        with mongo_session() as session:
+            collection.find_one({}, session=session)
+    Each thread or task should use its own session.
+    """
+    with get_client().start_session(causal_consistency=causal_consistency) as session:
+        yield session
 
 
 def connect_to_mongodb():
     """
-    Establish a connection to the local MongoDB server and return the database and collection objects.
+    Return the database and collection objects, using the shared MongoDB client.
+    The first call connects to the server; later calls reuse the same connection pool.
     Returns:
         tuple: (database, collection) if successful, (None, None) if failed
     """
     try:
-        # Connect to MongoDB running on localhost at the default port 27017
-        client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=2000)
-        
-        # Test the connection by sending a ping command
-        client.admin.command('ping')
-        print("Successfully connected to MongoDB!")
+        # Connect to MongoDB (by default running on localhost at the default port 27017)
+        client = get_client()
         
         # Access the 'environmental' database and 'noise_mapping' collection
-        db = client['environmental']
-        collection = db['noise_mapping']
+        db = client[DATABASE_NAME]
+        collection = db[COLLECTION_NAME]
         
         return db, collection
         
@@ -54,110 +188,1150 @@ def connect_to_mongodb():
         return None, None
 
 
-def load_csv_to_mongodb():
+def _is_null(value):
+    """Return True if a raw CSV value is one of the recognised null sentinels."""
+    return value.strip().lower() in NULL_SENTINELS
+
+
+def _number_text(value):
+    # Only strip commas that group thousands, so that '1,2,3' is not read as 123, and
+    # reject Python-only digit separators such as '1_000'
+    text = value.strip()
+    if '_' in text:
+        raise ValueError(f"Not a number: {value!r}")
+    if ',' in text:
+        if not GROUPED_NUMBER.match(text):
+            raise ValueError(f"Not a number: {value!r}")
+        text = text.replace(',', '')
+    return text
+
+
+def _parse_int(value):
+    number = int(_number_text(value))
+    if not INT64_MIN <= number <= INT64_MAX:
+        raise ValueError(f"Integer out of the 64-bit range: {value!r}")
+    return number
+
+
+def _parse_float(value):
+    return float(_number_text(value))
+
+
+def _make_converter(kind):
     """
-    Load data from a CSV file into the MongoDB collection.
-    This function will delete any existing data in the collection prior to loading new data.
+    Build the scalar converter for one column type.
+    Values that are null sentinels become None; values that do not fit the
+    column type are kept as the original string rather than being lost.
     """
-    db, collection = connect_to_mongodb()
-    
-    if db is None or collection is None:
-        print("Failed to connect to MongoDB. Cannot load data.")
+    if kind == 'int':
+        parse = _parse_int
+    elif kind == 'float':
+        parse = _parse_float
+    elif kind.startswith('date:'):
+        date_format = kind[len('date:'):]
+        parse = lambda value: datetime.strptime(value.strip(), date_format)
+    else:
+        parse = None
+
+    def convert(value):
+        if value is None or _is_null(value):
+            return None
+        if parse is None:
+            return value
+        try:
+            return parse(value)
+        except ValueError:
+            return value
+
+    return convert
+
+
+def _value_kind(value):
+    """Return the narrowest column type that a single non-null raw value fits."""
+    try:
+        # Integers outside the 64-bit range fail here and are counted as floats below
+        _parse_int(value)
+        return 'int'
+    except ValueError:
+        pass
+    try:
+        _parse_float(value)
+        return 'float'
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            datetime.strptime(value.strip(), date_format)
+            return 'date:' + date_format
+        except ValueError:
+            pass
+    return 'string'
+
+
+def infer_schema(csv_file_path, sample_rows=1000):
+    """
+    Infer one type per column by sampling the first rows of a CSV file.
+    Each column is given the narrowest type that all of its non-null sampled
+    values fit: 'int', 'float', 'date:<format>', 'string', or 'null' if every
+    sampled value was a null sentinel such as 'n/a'.
+    Args:
+        csv_file_path (str): Path to the CSV file
+        sample_rows (int): Number of rows to sample
+    Returns:
+        dict: Column name -> type name
+    """
+    schema = {}
+    for header, rows in iter_csv_chunks(csv_file_path, sample_rows):
+        for index, name in enumerate(header):
+            kinds = {_value_kind(row[index]) for row in rows
+                     if index < len(row) and not _is_null(row[index])}
+            if not kinds:
+                schema[name] = 'null'
+            elif len(kinds) == 1:
+                schema[name] = kinds.pop()
+            elif kinds == {'int', 'float'}:
+                schema[name] = 'float'
+            else:
+                schema[name] = 'string'
+        break
+    return schema
+
+
+def print_schema(schema):
+    """Print the column types chosen by infer_schema()."""
+    print("Inferred column types:")
+    for name, kind in schema.items():
+        print(f"  - {name}: {kind}")
+
+
+def convert_column(values, kind):
+    """
+    Convert every value of one column with the converter for its type.
+    Clean numeric columns are parsed in a single map() over the whole column,
+    and date columns parse each distinct value only once, so the per-value
+    work is only done for columns that contain nulls or stray values.
+    Args:
+        values (sequence): Raw values of the column
+        kind (str): Column type, as returned by infer_schema()
+    Returns:
+        list: Converted values
+    """
+    if kind in ('int', 'float'):
+        try:
+            converted = list(map(int if kind == 'int' else float, values))
+        except (ValueError, TypeError):
+            # Nulls, separators or stray text somewhere in the column
+            converted = None
+        # int() and float() also accept '1_000', and int() any size of integer,
+        # so those columns go through the checked converter below
+        if converted is not None and not any('_' in value for value in values) and \
+                (kind == 'float' or not converted or
+                 (INT64_MIN <= min(converted) and max(converted) <= INT64_MAX)):
+            return converted
+    elif kind.startswith('date:'):
+        convert = _make_converter(kind)
+        parsed = {value: convert(value) for value in set(values)}
+        return list(map(parsed.__getitem__, values))
+    return list(map(_make_converter(kind), values))
+
+
+def convert_columns(header, rows, schema):
+    """
+    Convert a chunk of raw CSV rows column by column using a fixed schema.
+    Args:
+        header (list): Column names
+        rows (list): Raw rows (lists of strings)
+        schema (dict): Column name -> type name, as returned by infer_schema()
+    Returns:
+        list: One list of converted values per column, in header order
+    """
+    width = len(header)
+    # Pad or trim ragged rows so that every column has one value per row
+    if any(len(row) != width for row in rows):
+        rows = [(row + [None] * width)[:width] for row in rows]
+    columns = list(zip(*rows)) if rows else [() for _ in header]
+
+    return [convert_column(values, schema.get(name, 'string'))
+            for name, values in zip(header, columns)]
+
+
+def iter_csv_chunks(csv_file_path, chunk_size=5000):
+    """
+    Read a CSV file lazily and yield chunks of raw (unconverted) rows.
+    Args:
+        csv_file_path (str): Path to the CSV file
+        chunk_size (int): Number of rows per chunk
+    Yields:
+        tuple: (header, rows) where header is the list of column names and
+               rows is a list of lists of strings
+    """
+    with open(csv_file_path, 'r', encoding='utf-8', newline='') as csvfile:
+        csv_reader = csv.reader(csvfile)
+        header = next(csv_reader, None)
+        if header is None:
+            return
+
+        rows = []
+        for row in csv_reader:
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield header, rows
+                rows = []
+        if rows:
+            yield header, rows
+
+
+def build_documents(header, rows, schema):
+    """
+    Turn a chunk of raw CSV rows into MongoDB documents with converted values.
+    Values are converted column-wise with one converter per column (see infer_schema()).
+    This is a plain top-level function so that it can be run in worker processes.
+    Args:
+        header (list): Column names
+        rows (list): Raw rows (lists of strings)
+        schema (dict): Column name -> type name
+    Returns:
+        list: Documents ready for insert_many
+    """
+    columns = convert_columns(header, rows, schema)
+    names = list(header)
+    # Add the lower-case copies of the prefix search fields used by prefix_filter()
+    for field in PREFIX_SEARCH_FIELDS:
+        if field in header:
+            values = columns[header.index(field)]
+            names.append(field + LOWERCASE_SUFFIX)
+            columns.append([value.lower() if isinstance(value, str) else None for value in values])
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def split_by_bson_size(docs, max_batch_bytes=8 * 1024 * 1024):
+    """
+    Split a list of documents into batches whose encoded BSON size stays under a limit.
+    Args:
+        docs (list): Documents to split
+        max_batch_bytes (int): Maximum encoded BSON size of a batch (None for no size limit)
+    Yields:
+        list: A batch of documents
+    """
+    if not max_batch_bytes:
+        if docs:
+            yield docs
         return
 
+    batch = []
+    batch_bytes = 0
+    for doc in docs:
+        doc_bytes = len(bson.encode(doc))
+        # Start a new batch if this document would take us over the size limit
+        if batch and batch_bytes + doc_bytes > max_batch_bytes:
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(doc)
+        batch_bytes += doc_bytes
+    if batch:
+        yield batch
+
+
+def iter_csv_batches(csv_file_path, schema, batch_size=5000, max_batch_bytes=8 * 1024 * 1024):
+    """
+    Read a CSV file lazily and yield lists of converted documents.
+    Only one batch is held in memory at a time, so memory use stays flat
+    however large the file is.
+    Args:
+        csv_file_path (str): Path to the CSV file
+        schema (dict): Column name -> type name, as returned by infer_schema()
+        batch_size (int): Maximum number of documents per batch
+        max_batch_bytes (int): Maximum encoded BSON size of a batch (None for no size limit)
+    Yields:
+        list: A batch of documents ready for insert_many
+    """
+    for header, rows in iter_csv_chunks(csv_file_path, batch_size):
+        yield from split_by_bson_size(build_documents(header, rows, schema), max_batch_bytes)
+
+
+def start_shadow_load(collection):
+    """
+    Prepare an empty shadow collection to load a full refresh of a collection into.
+    Args:
+        collection: The live collection that will be replaced
+    Returns:
+        Collection: The (emptied) shadow collection
+    """
+    shadow = collection.database[collection.name + SHADOW_SUFFIX]
+    # Remove anything left behind by an earlier load that failed part way through
+    shadow.drop()
+    print(f"Loading into shadow collection {shadow.name} "
+          f"({collection.name} stays available while loading)...")
+    return shadow
+
+
+def swap_in_shadow(shadow, collection):
+    """
+    Atomically replace the live collection with a fully loaded shadow collection.
+    This uses renameCollection with dropTarget, so readers see either the old data
+    or the new data, never a partly loaded collection. (renameCollection is not
+    supported on sharded collections.)
+    Args:
+        shadow: The loaded shadow collection
+        collection: The live collection to replace
+    """
+    shadow.rename(collection.name, dropTarget=True)
+    print(f"Swapped {shadow.name} in as {collection.name}.")
+
+
+def abandon_shadow_load(shadow):
+    """Drop a partly loaded shadow collection after a failed load, leaving the live data untouched."""
+    if shadow is None:
+        return
+    try:
+        shadow.drop()
+        print(f"Dropped partly loaded {shadow.name}; the existing data was left unchanged.")
+    except Exception as e:
+        print(f"Could not drop {shadow.name}: {str(e)}")
+
+
+def load_csv_to_mongodb(csv_file_path=None, collection=None, batch_size=5000,
+                        max_batch_bytes=8 * 1024 * 1024, report_every=10,
+                        schema=None, sample_rows=1000):
+    """
+    Load data from a CSV file into the MongoDB collection, replacing any existing data.
+    The data is loaded into a shadow collection which is then swapped in for the live one
+    in a single renameCollection, so queries never see an empty or half-loaded collection.
+    The file is streamed in batches, and each batch is sent with an unordered insert_many
+    as soon as it is ready, so large files never have to fit in memory.
+    Args:
+        csv_file_path (str): Path to the CSV file (defaults to data/noise_mapping_round_3.csv)
+        collection: Target collection (defaults to the noise_mapping collection)
+        batch_size (int): Maximum number of documents per insert_many call
+        max_batch_bytes (int): Maximum encoded BSON size of each insert_many call
+        report_every (int): Print progress every this many batches
+        schema (dict): Column types (inferred from the first sample_rows rows if not given)
+        sample_rows (int): Number of rows sampled to infer the schema
+    Returns:
+        dict: Load statistics (rows, batches, seconds, rows_per_second, batch_latencies),
+              or None if the load failed
+    """
+    if collection is None:
+        db, collection = connect_to_mongodb()
+
+        if db is None or collection is None:
+            print("Failed to connect to MongoDB. Cannot load data.")
+            return None
+
     # CSV is downloaded from https://www.data.gov.uk/dataset/d461bbc1-eb51-4852-8a9a-45dbf28aa230/noise-exposure-data-round-3
     # Define the path to the CSV file
-    csv_file_path = os.path.join('data', 'noise_mapping_round_3.csv')
+    if csv_file_path is None:
+        csv_file_path = os.path.join('data', 'noise_mapping_round_3.csv')
     
     # Check if the CSV file exists
     if not os.path.exists(csv_file_path):
         print(f"CSV file not found at: {csv_file_path}")
-        return
+        return None
     
+    shadow = None
     try:
-        # Delete all existing documents in the collection
-        print("Clearing existing data from noise_mapping collection...")
-        collection.delete_many({})
-        print("Existing data cleared successfully.")
-        
-        # Read the CSV file using the built-in csv module
+        # Load into a fresh shadow collection; the live collection stays readable meanwhile
+        shadow = start_shadow_load(collection)
+
+        # Stream the CSV file in batches, inserting each batch as soon as it is ready
         print(f"Reading CSV file: {csv_file_path}")
-        data = []
-        
-        with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-            csv_reader = csv.DictReader(csvfile)
-            for row in csv_reader:
-                # Convert string values to appropriate types where possible
-                for key, value in row.items():
-                    # Try to convert numeric strings to integers
-                    if value.isdigit():
-                        row[key] = int(value)
-                    # Handle 'n/a' values
-                    elif value.lower() == 'n/a':
-                        row[key] = None
-                
-                data.append(row)
-        
-        # Insert all records into the MongoDB collection
-        print(f"Inserting {len(data)} documents into noise_mapping collection...")
-        result = collection.insert_many(data)
-        
-        print(f"Successfully inserted {len(result.inserted_ids)} documents into the collection.")
+        total_rows = 0
+        batch_latencies = []
+        start = time.perf_counter()
+
+        if schema is None:
+            schema = infer_schema(csv_file_path, sample_rows)
+            print_schema(schema)
+
+        for batch in iter_csv_batches(csv_file_path, schema, batch_size, max_batch_bytes):
+            batch_start = time.perf_counter()
+            # Unordered inserts let the server apply the whole batch without stopping at the first error
+            result = shadow.insert_many(batch, ordered=False)
+            batch_latencies.append(time.perf_counter() - batch_start)
+            total_rows += len(result.inserted_ids)
+
+            if len(batch_latencies) % report_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  {total_rows:,} rows in {len(batch_latencies):,} batches "
+                      f"({total_rows / elapsed:,.0f} rows/s, last batch {batch_latencies[-1] * 1000:.1f} ms)")
+
+        # Build the indexes before the swap, so the collection is indexed as soon as it goes live
+        ensure_indexes(shadow)
+        swap_in_shadow(shadow, collection)
+
+        elapsed = time.perf_counter() - start
+        rows_per_second = total_rows / elapsed if elapsed > 0 else 0.0
+        print(f"Successfully inserted {total_rows:,} documents into the collection "
+              f"in {elapsed:.2f}s ({rows_per_second:,.0f} rows/s).")
+        if batch_latencies:
+            print(f"Batch latency: mean {1000 * sum(batch_latencies) / len(batch_latencies):.1f} ms, "
+                  f"max {1000 * max(batch_latencies):.1f} ms over {len(batch_latencies)} batches.")
+
+        return {
+            "rows": total_rows,
+            "batches": len(batch_latencies),
+            "seconds": elapsed,
+            "rows_per_second": rows_per_second,
+            "batch_latencies": batch_latencies,
+        }
         
     except Exception as e:
         print(f"Error loading CSV data: {str(e)}")
+        abandon_shadow_load(shadow)
+        return None
+
+
+def load_csv_to_mongodb_pipelined(csv_file_path=None, collection=None, workers=4, writers=4,
+                                  batch_size=5000, max_batch_bytes=8 * 1024 * 1024, queue_size=None,
+                                  schema=None, sample_rows=1000):
+    """
+    Load data from a CSV file into the MongoDB collection using a pipeline of stages:
+    one reader parses raw row chunks, a pool of worker processes converts them into
+    documents, and several writer threads run concurrent insert_many calls through the
+    collection's shared connection pool. Bounded queues between the stages provide
+    backpressure, so parsing, conversion and network round-trips overlap without
+    memory growing when one stage is slower than the others.
+    Like load_csv_to_mongodb(), the data is loaded into a shadow collection that replaces
+    the live collection only once the load has completed.
+    Args:
+        csv_file_path (str): Path to the CSV file (defaults to data/noise_mapping_round_3.csv)
+        collection: Target collection (defaults to the noise_mapping collection)
+        workers (int): Number of conversion processes (0 converts in the reader thread)
+        writers (int): Number of concurrent insert_many threads
+        batch_size (int): Number of rows per chunk, and maximum documents per insert_many call
+        max_batch_bytes (int): Maximum encoded BSON size of each insert_many call
+        queue_size (int): Capacity of each inter-stage queue (defaults to twice the consumers)
+        schema (dict): Column types (inferred from the first sample_rows rows if not given)
+        sample_rows (int): Number of rows sampled to infer the schema
+    Returns:
+        dict: Load statistics (rows, batches, seconds, rows_per_second, batch_latencies,
+              plus how long the reader waited on each downstream stage), or None if the load failed
+    """
+    if collection is None:
+        db, collection = connect_to_mongodb()
+
+        if db is None or collection is None:
+            print("Failed to connect to MongoDB. Cannot load data.")
+            return None
+
+    if csv_file_path is None:
+        csv_file_path = os.path.join('data', 'noise_mapping_round_3.csv')
+
+    if not os.path.exists(csv_file_path):
+        print(f"CSV file not found at: {csv_file_path}")
+        return None
+
+    writers = max(1, writers)
+    write_queue = queue.Queue(maxsize=queue_size or writers * 2)
+    max_in_flight = queue_size or max(1, workers) * 2
+    stats_lock = threading.Lock()
+    batch_latencies = []
+    errors = []
+    stop = threading.Event()
+    totals = {"rows": 0}
+
+    def writer():
+        # Each writer takes ready batches off the queue until it receives the None sentinel
+        while True:
+            batch = write_queue.get()
+            if batch is None:
+                break
+            if stop.is_set():
+                # Keep draining after a failure so that the reader never blocks on a full queue
+                continue
+            try:
+                batch_start = time.perf_counter()
+                result = shadow.insert_many(batch, ordered=False)
+                latency = time.perf_counter() - batch_start
+                with stats_lock:
+                    batch_latencies.append(latency)
+                    totals["rows"] += len(result.inserted_ids)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+    def enqueue(docs):
+        # Time spent blocked here means the writers (the network) are the slowest stage
+        wait_start = time.perf_counter()
+        for batch in split_by_bson_size(docs, max_batch_bytes):
+            write_queue.put(batch)
+        return time.perf_counter() - wait_start
+
+    pool = None
+    threads = []
+    shadow = None
+    try:
+        shadow = start_shadow_load(collection)
+
+        print(f"Reading CSV file: {csv_file_path} "
+              f"({workers} conversion workers, {writers} writers)")
+        start = time.perf_counter()
+        if schema is None:
+            schema = infer_schema(csv_file_path, sample_rows)
+            print_schema(schema)
+
+        threads = [threading.Thread(target=writer, name=f"mongo-writer-{n}", daemon=True)
+                   for n in range(writers)]
+        for thread in threads:
+            thread.start()
+
+        if workers > 0:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        pending = deque()
+        convert_wait = 0.0
+        write_wait = 0.0
+
+        for header, rows in iter_csv_chunks(csv_file_path, batch_size):
+            if stop.is_set():
+                break
+            if pool is None:
+                write_wait += enqueue(build_documents(header, rows, schema))
+                continue
+
+            pending.append(pool.submit(build_documents, header, rows, schema))
+            # Bound the number of chunks in conversion so the reader cannot run ahead of the workers
+            while len(pending) >= max_in_flight:
+                wait_start = time.perf_counter()
+                docs = pending.popleft().result()
+                convert_wait += time.perf_counter() - wait_start
+                write_wait += enqueue(docs)
+
+        while pending:
+            wait_start = time.perf_counter()
+            docs = pending.popleft().result()
+            convert_wait += time.perf_counter() - wait_start
+            if not stop.is_set():
+                write_wait += enqueue(docs)
+
+        for _ in threads:
+            write_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        ensure_indexes(shadow)
+        swap_in_shadow(shadow, collection)
+
+        elapsed = time.perf_counter() - start
+        total_rows = totals["rows"]
+        rows_per_second = total_rows / elapsed if elapsed > 0 else 0.0
+        print(f"Successfully inserted {total_rows:,} documents into the collection "
+              f"in {elapsed:.2f}s ({rows_per_second:,.0f} rows/s).")
+        if batch_latencies:
+            ordered = sorted(batch_latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            print(f"Batch latency: mean {1000 * sum(ordered) / len(ordered):.1f} ms, "
+                  f"p99 {1000 * p99:.1f} ms over {len(ordered)} batches.")
+        print(f"Reader waited {convert_wait:.2f}s on conversion and {write_wait:.2f}s on writers.")
+
+        return {
+            "rows": total_rows,
+            "batches": len(batch_latencies),
+            "seconds": elapsed,
+            "rows_per_second": rows_per_second,
+            "batch_latencies": batch_latencies,
+            "convert_wait_seconds": convert_wait,
+            "write_wait_seconds": write_wait,
+        }
+
+    except Exception as e:
+        print(f"Error loading CSV data: {str(e)}")
+        abandon_shadow_load(shadow)
+        return None
+
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        # Make sure no writer thread is left waiting on the queue after a failure
+        stop.set()
+        for thread in threads:
+            if thread.is_alive():
+                write_queue.put(None)
+
+
+def row_hash(row):
+    """
+    Return a stable hash of a raw CSV row, used to detect changed rows between loads.
+    Args:
+        row (list): Raw row (list of strings)
+    Returns:
+        str: Hex digest of the row's values
+    """
+    return hashlib.blake2b('\x1f'.join(row).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_csv_to_mongodb_incremental(csv_file_path=None, collection=None, key_field=None,
+                                    batch_size=5000, schema=None, sample_rows=1000):
+    """
+    Bring the MongoDB collection in line with a CSV file by applying only the differences.
+    Each row is identified by a key: the value of key_field (for example
+    'Location/Agglomeration') if given, otherwise a hash of the whole row. The key is
+    stored as the document _id, the row hash as _row_hash and the key field as _key_field,
+    so the previously loaded hashes (the manifest) can be read back from the collection
+    itself. Rows that are new
+    are inserted, rows whose hash changed are replaced, and documents whose key no longer
+    appears in the file are deleted, all as unordered bulk_write batches. Running it again
+    on an unchanged file writes nothing.
+    Collections loaded with load_csv_to_mongodb() use generated ids and have no row
+    hashes, so the first incremental run against one of them loads every row into a
+    shadow collection and swaps it in, as a full load does. Readers see either the old
+    documents or the new ones, never both. The same happens when key_field differs from
+    the one used by the previous load, since every document then gets a new _id.
+    Rows whose key has already been seen in the file are skipped, and their keys are
+    printed and returned so that the lost rows can be found.
+    Args:
+        csv_file_path (str): Path to the CSV file (defaults to data/noise_mapping_round_3.csv)
+        collection: Target collection (defaults to the noise_mapping collection)
+        key_field (str): Column holding a unique natural key (None to key rows by their hash)
+        batch_size (int): Maximum number of operations per bulk_write call
+        schema (dict): Column types (inferred from the first sample_rows rows if not given)
+        sample_rows (int): Number of rows sampled to infer the schema
+    Returns:
+        dict: Counts of inserted, updated, deleted, unchanged and duplicate rows, the
+              duplicate keys and timings, or None if the load failed
+    """
+    if collection is None:
+        db, collection = connect_to_mongodb()
+
+        if db is None or collection is None:
+            print("Failed to connect to MongoDB. Cannot load data.")
+            return None
+
+    if csv_file_path is None:
+        csv_file_path = os.path.join('data', 'noise_mapping_round_3.csv')
+
+    if not os.path.exists(csv_file_path):
+        print(f"CSV file not found at: {csv_file_path}")
+        return None
+
+    shadow = None
+    try:
+        start = time.perf_counter()
+        if schema is None:
+            schema = infer_schema(csv_file_path, sample_rows)
+            print_schema(schema)
+
+        # Read back the manifest of keys and hashes from the previous load
+        manifest = {}
+        previous_key_fields = set()
+        for doc in collection.find({}, {'_row_hash': 1, '_key_field': 1}):
+            manifest[doc['_id']] = doc.get('_row_hash')
+            if '_key_field' in doc:
+                previous_key_fields.add(doc['_key_field'])
+            elif doc['_id'] == doc.get('_row_hash'):
+                # Written before _key_field was stored: rows keyed by their own hash
+                previous_key_fields.add(None)
+        print(f"Manifest holds {len(manifest):,} previously loaded rows.")
+
+        counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "duplicates": 0}
+        duplicate_keys = []
+        batch_latencies = []
+        seen = set()
+
+        # Documents without a row hash came from a full load, under generated ids, and a
+        # different key field gives every row a new id. Rewriting them in place would
+        # briefly show both the old and the new documents, so convert the collection by
+        # loading every row into a shadow collection and swapping it in.
+        target = collection
+        replaced = 0
+        reason = None
+        if any(digest is None for digest in manifest.values()):
+            reason = "was not loaded incrementally"
+        elif previous_key_fields - {key_field}:
+            reason = "was keyed by " + ", ".join("row hashes" if field is None else repr(field)
+                                                 for field in previous_key_fields)
+        if reason is not None:
+            print(f"{collection.name} {reason}; converting it through a shadow collection.")
+            shadow = target = start_shadow_load(collection)
+            replaced = len(manifest)
+            manifest = {}
+
+        def flush(operations):
+            batch_start = time.perf_counter()
+            result = target.bulk_write(operations, ordered=False)
+            batch_latencies.append(time.perf_counter() - batch_start)
+            counts["inserted"] += result.inserted_count
+            counts["updated"] += result.modified_count
+            counts["deleted"] += result.deleted_count
+
+        print(f"Reading CSV file: {csv_file_path}")
+        operations = []
+        for header, rows in iter_csv_chunks(csv_file_path, batch_size):
+            if key_field is not None and key_field not in header:
+                raise KeyError(f"Key field '{key_field}' is not a column of {csv_file_path}")
+            key_index = None if key_field is None else header.index(key_field)
+
+            # Hash the raw rows first, so unchanged rows are skipped before any type conversion
+            changed_rows = []
+            changed_keys = []
+            for row in rows:
+                digest = row_hash(row)
+                key = digest if key_index is None else row[key_index]
+                if key in seen:
+                    counts["duplicates"] += 1
+                    duplicate_keys.append(key)
+                    continue
+                seen.add(key)
+                if manifest.get(key) == digest:
+                    counts["unchanged"] += 1
+                    continue
+                changed_rows.append(row)
+                changed_keys.append((key, digest))
+
+            for doc, (key, digest) in zip(build_documents(header, changed_rows, schema), changed_keys):
+                doc['_id'] = key
+                doc['_row_hash'] = digest
+                doc['_key_field'] = key_field
+                if key in manifest:
+                    operations.append(ReplaceOne({'_id': key}, doc))
+                else:
+                    operations.append(InsertOne(doc))
+                if len(operations) >= batch_size:
+                    flush(operations)
+                    operations = []
+
+        # Anything in the manifest that was not in this file has been removed at source
+        stale_keys = [key for key in manifest if key not in seen]
+        for index in range(0, len(stale_keys), batch_size):
+            operations.append(DeleteMany({'_id': {'$in': stale_keys[index:index + batch_size]}}))
+            if len(operations) >= batch_size:
+                flush(operations)
+                operations = []
+        if operations:
+            flush(operations)
+        ensure_indexes(target)
+        if shadow is not None:
+            swap_in_shadow(shadow, collection)
+            counts["deleted"] += replaced
+
+        elapsed = time.perf_counter() - start
+        print(f"Incremental load finished in {elapsed:.2f}s: {counts['inserted']:,} inserted, "
+              f"{counts['updated']:,} updated, {counts['deleted']:,} deleted, "
+              f"{counts['unchanged']:,} unchanged.")
+        if counts["duplicates"]:
+            shown = ", ".join(repr(key) for key in duplicate_keys[:10])
+            more = f" and {len(duplicate_keys) - 10:,} more" if len(duplicate_keys) > 10 else ""
+            print(f"Skipped {counts['duplicates']:,} rows whose key had already been seen in the file "
+                  f"(only the first row of each key is loaded): {shown}{more}")
+
+        return dict(counts, duplicate_keys=duplicate_keys, seconds=elapsed,
+                    batches=len(batch_latencies), batch_latencies=batch_latencies)
+
+    except Exception as e:
+        print(f"Error loading CSV data: {str(e)}")
+        abandon_shadow_load(shadow)
+        return None
 
 
-def main():
+def ensure_indexes(collection):
+    """
+    Create the indexes used by the prefix queries, if they do not already exist.
+    For each field in PREFIX_SEARCH_FIELDS this builds a compound index on the lower-case
+    copy and the original field, and back-fills the lower-case copy on any documents that
+    were loaded without it. Creating an index that already exists is a no-op.
+    Args:
+        collection: The collection to index
+    Returns:
+        list: Names of the indexes
+    """
+    names = []
+    for field in PREFIX_SEARCH_FIELDS:
+        lower_field = field + LOWERCASE_SUFFIX
+        # $toLower is only exact for ASCII text, which matches Python's lower() for these names
+        collection.update_many({lower_field: {"$exists": False}, field: {"$type": "string"}},
+                               [{"$set": {lower_field: {"$toLower": "$" + field}}}])
+        names.append(collection.create_index([(lower_field, ASCENDING), (field, ASCENDING)]))
+    print(f"Indexes ready on {collection.name}: {', '.join(names)}")
+    return names
+
+
+def prefix_filter(field, prefix):
+    """
+    Build an index-friendly, case-insensitive 'starts with' filter.
+    Instead of a case-insensitive regex, which cannot use an ordinary index, the query
+    becomes a range scan on the indexed lower-case copy of the field:
+    'M' -> {'<field>_lower': {'$gte': 'm', '$lt': 'n'}}.
+    Args:
+        field (str): One of PREFIX_SEARCH_FIELDS
+        prefix (str): The prefix to match, in any case
+    Returns:
+        dict: The query filter
+    """
+    if field not in PREFIX_SEARCH_FIELDS:
+        raise ValueError(f"'{field}' has no lower-case index; add it to PREFIX_SEARCH_FIELDS")
+    lower_field = field + LOWERCASE_SUFFIX
+    lower_prefix = prefix.lower()
+    if not lower_prefix:
+        return {lower_field: {"$type": "string"}}
+    # The smallest string greater than every string starting with the prefix
+    upper_bound = lower_prefix[:-1] + chr(ord(lower_prefix[-1]) + 1)
+    return {lower_field: {"$gte": lower_prefix, "$lt": upper_bound}}
+
+
+def _plan_stages(plan):
+    """Return the names of every stage in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def check_query_plan(collection, query_filter, projection=None):
+    """
+    Run explain() on a query and fail loudly if it would scan the whole collection.
+    Args:
+        collection: The collection to query
+        query_filter (dict): The query filter
+        projection (dict): The query projection
+    Returns:
+        list: The stages of the winning plan, e.g. ['PROJECTION_COVERED', 'IXSCAN']
+    Raises:
+        QueryPlanError: If the winning plan contains a COLLSCAN stage
+    """
+    explanation = collection.find(query_filter, projection).explain()
+    stages = _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+    if "COLLSCAN" in stages:
+        raise QueryPlanError(
+            f"Query {query_filter} on {collection.name} would scan the whole collection "
+            f"(plan: {' -> '.join(stages)}). Reload the data or call ensure_indexes().")
+    return stages
+
+
+def query_with_counts(collection, query_filter, projection=None, page_size=None):
+    """
+    Fetch a page of matching documents, the filtered count and the total count with
+    as few round-trips as possible.
+    The page and the filtered count come from a single aggregation: the $match runs
+    once (using any index) and a $facet splits its output into the page and a $count.
+    The unfiltered total comes from estimated_document_count(), which reads the
+    collection metadata instead of counting documents.
+    Note that the $facet result is returned as one document, so a page must fit within
+    MongoDB's 16 MB document limit. For large results use page_size, or pass page_size=0
+    to get only the counts and stream the documents with a find() cursor.
+    Args:
+        collection: The collection to query
+        query_filter (dict): The query filter
+        projection (dict): Fields to return for each document (None for whole documents)
+        page_size (int): Maximum number of documents to return (None for all, 0 for none)
+    Returns:
+        dict: {'page': list of documents, 'filtered_count': int, 'total_count': int}
+    """
+    facets = {"filtered": [{"$count": "n"}]}
+    if page_size != 0:
+        page_stages = []
+        if page_size:
+            page_stages.append({"$limit": page_size})
+        if projection:
+            page_stages.append({"$project": projection})
+        # A facet needs at least one stage; $skip 0 passes documents straight through
+        facets["page"] = page_stages or [{"$skip": 0}]
+    pipeline = [{"$match": query_filter}, {"$facet": facets}]
+    result = next(collection.aggregate(pipeline), {"filtered": []})
+    filtered_count = result["filtered"][0]["n"] if result["filtered"] else 0
+
+    return {
+        "page": result.get("page", []),
+        "filtered_count": filtered_count,
+        "total_count": collection.estimated_document_count(),
+    }
+
+
+def _plain_value(value):
+    """Convert a BSON value to something CSV and Parquet writers understand."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _unify_arrow_schemas(schemas):
+    """
+    Merge the schemas of several Arrow tables into one that all of them fit.
+    Columns keep the order in which they were first seen. A column that is null in
+    some tables takes its type from the others, numeric types are promoted (int to
+    double and so on), and a column whose types cannot be merged becomes a string.
+    Args:
+        schemas (list): pyarrow.Schema of each table
+    Returns:
+        pyarrow.Schema: The merged schema
+    """
+    import pyarrow as pa
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, []).append(field.type)
+    fields = []
+    for name, kinds in types.items():
+        try:
+            merged = pa.unify_schemas([pa.schema([(name, kind)]) for kind in kinds],
+                                      promote_options="permissive").field(name).type
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            merged = pa.string()
+        fields.append(pa.field(name, merged))
+    return pa.schema(fields)
+
+
+def _conform_table(table, schema):
+    """
+    Reorder and cast a table to a schema, adding any missing columns as nulls.
+    Args:
+        table (pyarrow.Table): The table to convert
+        schema (pyarrow.Schema): The schema to convert it to
+    Returns:
+        pyarrow.Table: The converted table
+    """
+    import pyarrow as pa
+    columns = [table.column(field.name).cast(field.type) if field.name in table.column_names
+               else pa.nulls(table.num_rows, field.type)
+               for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def export_query(collection, query_filter, projection=None, output=None, fmt="ndjson",
+                 batch_size=1000, page_size=None, parquet_schema=None):
+    """
+    Stream the results of a query to a file or stdout as NDJSON, CSV, Parquet or raw BSON.
+    Documents are fetched with find_raw_batches(), so each server batch arrives as raw
+    BSON bytes and is decoded in a single call (or, for the 'bson' format, not decoded at
+    all) instead of building one Python dict per document as it comes off the cursor.
+    Each batch is written with a single write, and only one batch is held in memory.
+    With page_size set, the results are read with keyset pagination on _id (each page
+    asks for _id greater than the last one seen) instead of one long-running cursor,
+    which avoids skip/limit costs and lets very large exports be resumed.
+    Parquet files have a single schema, but each batch is typed from its own values,
+    so a column may be all None in one batch or missing from another. Given
+    parquet_schema, every batch is converted to it as it is written. Otherwise each
+    batch is first written to a temporary part file, and the parts are then merged
+    into the output under one schema that all of them fit (see _unify_arrow_schemas()).
+    Missing columns are filled with nulls in both cases.
+    Progress messages go to stderr so that stdout can carry the data.
+    Args:
+        collection: The collection to query
+        query_filter (dict): The query filter
+        projection (dict): Fields to return for each document (None for whole documents)
+        output (str): Output file path (None for stdout; Parquet needs a file path)
+        fmt (str): 'ndjson', 'csv', 'parquet' or 'bson'
+        batch_size (int): Number of documents per server batch
+        page_size (int): Documents per keyset page (None for a single cursor)
+        parquet_schema (pyarrow.Schema): Schema of the Parquet file (None to infer it)
+    Returns:
+        dict: Export statistics (documents, batches, seconds)
+    """
+    if fmt not in ("ndjson", "csv", "parquet", "bson"):
+        raise ValueError(f"Unknown export format '{fmt}'")
+    if fmt == "parquet" and output is None:
+        raise ValueError("Parquet export needs an output file path")
+
+    # Keyset pagination needs the _id of the last document, even if it is not exported
+    drop_id = False
+    if page_size and projection and not projection.get("_id", 1):
+        projection = dict(projection, _id=1)
+        drop_id = True
+
+    def raw_batches():
+        if not page_size:
+            yield from collection.find_raw_batches(query_filter, projection, batch_size=batch_size)
+            return
+        last_id = None
+        while True:
+            page_filter = query_filter if last_id is None else \
+                {"$and": [query_filter, {"_id": {"$gt": last_id}}]}
+            found = 0
+            for data in collection.find_raw_batches(page_filter, projection, sort=[("_id", ASCENDING)],
+                                                    limit=page_size, batch_size=batch_size):
+                docs = bson.decode_all(data, RAW_CODEC_OPTIONS)
+                if docs:
+                    found += len(docs)
+                    last_id = docs[-1]["_id"]
+                yield data
+            if found < page_size:
+                return
+
+    binary = fmt in ("parquet", "bson")
+    if output is None:
+        out = sys.stdout.buffer if binary else sys.stdout
+        close_output = False
+    else:
+        out = open(output, "wb" if binary else "w", encoding=None if binary else "utf-8",
+                   newline=None if binary else "")
+        close_output = True
+
+    documents = 0
+    batches = 0
+    csv_writer = None
+    parquet_writer = None
+    parquet_parts = []
+    parts_dir = None
+    if fmt == "parquet" and parquet_schema is None:
+        parts_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output)))
+    start = time.perf_counter()
+    try:
+        for data in raw_batches():
+            batches += 1
+            if fmt == "bson":
+                # Raw BSON is written exactly as the server sent it, without decoding
+                if drop_id:
+                    docs = [bson.encode({k: v for k, v in doc.items() if k != "_id"})
+                            for doc in bson.decode_all(data)]
+                    data = b"".join(docs)
+                    documents += len(docs)
+                else:
+                    documents += len(bson.decode_all(data, RAW_CODEC_OPTIONS))
+                out.write(data)
+                continue
+
+            docs = bson.decode_all(data)
+            if drop_id:
+                for doc in docs:
+                    doc.pop("_id", None)
+            documents += len(docs)
+            if not docs:
+                continue
+
+            if fmt == "ndjson":
+                out.write("".join(json.dumps(doc, default=json_util.default) + "\n" for doc in docs))
+            elif fmt == "csv":
+                if csv_writer is None:
+                    csv_writer = csv.DictWriter(out, fieldnames=list(docs[0].keys()), extrasaction="ignore")
+                    csv_writer.writeheader()
+                csv_writer.writerows({k: _plain_value(v) for k, v in doc.items()} for doc in docs)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pylist([{k: _plain_value(v) for k, v in doc.items()} for doc in docs])
+                if parquet_schema is not None:
+                    if parquet_writer is None:
+                        parquet_writer = pq.ParquetWriter(out, parquet_schema)
+                    parquet_writer.write_table(_conform_table(table, parquet_schema))
+                else:
+                    part = os.path.join(parts_dir.name, f"part-{len(parquet_parts):06d}.parquet")
+                    pq.write_table(table, part)
+                    parquet_parts.append((part, table.schema))
+
+        if parquet_parts:
+            # Merge the parts one at a time under a schema that every part fits
+            schema = _unify_arrow_schemas([part_schema for _, part_schema in parquet_parts])
+            parquet_writer = pq.ParquetWriter(out, schema)
+            for part, _ in parquet_parts:
+                parquet_writer.write_table(_conform_table(pq.read_table(part), schema))
+    finally:
+        if parts_dir is not None:
+            parts_dir.cleanup()
+        if parquet_writer is not None:
+            parquet_writer.close()
+        if close_output:
+            out.close()
+        else:
+            out.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"Exported {documents:,} documents in {batches:,} batches as {fmt} "
+          f"in {elapsed:.2f}s ({documents / elapsed if elapsed > 0 else 0:,.0f} docs/s).",
+          file=sys.stderr)
+    return {"documents": documents, "batches": batches, "seconds": elapsed}
+
+
+def main(check_plan=False):
     """
     Main function to demonstrate querying MongoDB for documents where the
     'Location/Agglomeration' field starts with the letter 'M'.
-    Also prints the structure of a sample document for reference.
+    The matching documents are read with one cursor, which counts them as they are
+    printed, so the filter is only evaluated once; the total comes from the
+    collection metadata.
+    Args:
+        check_plan (bool): Run explain() first and stop if the query would scan the
+                           whole collection (costs an extra round-trip)
     """
     db, collection = connect_to_mongodb()
     
     if db is not None and collection is not None:
-        # Display the structure of a sample document to help you understand the data
-        print("Checking document structure ...")
-        sample_doc = collection.find_one()
-        if sample_doc:
-            print("Sample document fields:")
-            for key in sample_doc.keys():
-                print(f"  - {key}")
-            #print(f"\nSample document:")
-            #pprint.pprint(sample_doc, sort_dicts=False)
-        else:
-            print("No documents found in the collection to display structure.")
+        # The total number of documents is read from the collection metadata, without counting
+        total_count = collection.estimated_document_count()
+        print(f"Total number of documents in collection: {total_count}")
+        if not total_count:
+            print("No documents found in the collection.")
             return
         
-        # Count the number of matching unfiltered documents
-        total_doc_count = collection.count_documents({})
-        print(f"Total number of documents in collection: {total_doc_count}")
-
         # Query for those documents where 'Location/Agglomeration' starts with 'M' (case-insensitive)
-        # and return only the 'Location/Agglomeration' field
-        print("\n" + "="*50)
-        query_filter = {"Location/Agglomeration": {"$regex": r"^M", "$options": "i"}}
+        # and return only the 'Location/Agglomeration' field.
+        # prefix_filter() turns this into a range scan on the indexed lower-case copy of the field,
+        # equivalent to {"Location/Agglomeration": {"$regex": r"^M", "$options": "i"}}
+        query_filter = prefix_filter("Location/Agglomeration", "M")
         projection = {"Location/Agglomeration": 1, "_id": 0}  # Only return Location/Agglomeration field
-        results = collection.find(query_filter, projection)
-        
 
-        # Count the number of matching filtered documents
-        filtered_doc_count = collection.count_documents(query_filter)
-        print(f"Number of filtered documents starting with 'M': {filtered_doc_count}")
+        # Optionally make sure the query uses the index rather than scanning every document
+        print("\n" + "="*50)
+        if check_plan:
+            stages = check_query_plan(collection, query_filter, projection)
+            print(f"Query plan: {' -> '.join(stages)}")
         
-        # Print each matching document in a readable format
+        # Stream the matching documents with a cursor, printing each in a readable format
+        # and counting them as they go
         print("Documents where 'Location/Agglomeration' starts with 'M':")
-        found = False
-        for doc in results:
+        filtered_count = 0
+        for doc in collection.find(query_filter, projection):
             pprint.pprint(doc, sort_dicts=False)
-            found = True
-        if not found:
+            filtered_count += 1
+        if not filtered_count:
             print("No documents found.")
+        print(f"Number of filtered documents starting with 'M': {filtered_count}")
 
 
 if __name__ == "__main__":
-    # Comment or Uncomment the following line to load data from the CSV file into MongoDB.
-    # This can be run once, or whenever you want to refresh the data.
-    load_csv_to_mongodb()
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the noise mapping CSV into MongoDB and query it.")
+    parser.add_argument("--csv", default=None,
+                        help="Path to the CSV file (default: data/noise_mapping_round_3.csv)")
+    parser.add_argument("--no-load", action="store_true",
+                        help="Skip loading the CSV and only run the queries")
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full",
+                        help="full: reload everything and swap it in; incremental: apply only the changes")
+    parser.add_argument("--key-field", default=None,
+                        help="Natural key column for incremental loads (default: hash of the whole row)")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="Maximum number of documents per insert_many call")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Conversion worker processes; setting this or --writers enables pipelined ingest")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of concurrent insert_many threads for pipelined ingest")
+    parser.add_argument("--export", choices=["ndjson", "csv", "parquet", "bson"], default=None,
+                        help="Stream the query results in this format instead of printing them")
+    parser.add_argument("--output", default=None,
+                        help="File to export to (default: stdout)")
+    parser.add_argument("--export-batch-size", type=int, default=1000,
+                        help="Number of documents fetched per server batch when exporting")
+    parser.add_argument("--page-size", type=int, default=None,
+                        help="Export with keyset pagination on _id, this many documents per page")
+    parser.add_argument("--check-plan", action="store_true",
+                        help="Check with explain() that the query uses an index before running it")
+    args = parser.parse_args()
+
+    # Loading can be run once, or whenever you want to refresh the data.
+    # Use --no-load to skip it and only run the queries.
+    # When exporting, progress messages go to stderr so that stdout can carry the data.
+    with redirect_stdout(sys.stderr if args.export else sys.stdout):
+        if not args.no_load:
+            if args.mode == "incremental":
+                load_csv_to_mongodb_incremental(args.csv, key_field=args.key_field,
+                                                batch_size=args.batch_size)
+            elif args.workers > 0 or args.writers > 1:
+                load_csv_to_mongodb_pipelined(args.csv, workers=args.workers, writers=args.writers,
+                                              batch_size=args.batch_size)
+            else:
+                load_csv_to_mongodb(args.csv, batch_size=args.batch_size)
+        if args.export:
+            db, collection = connect_to_mongodb()
+
+    if not args.export:
+        main(check_plan=args.check_plan)
+    elif collection is not None:
+        export_query(collection, prefix_filter("Location/Agglomeration", "M"),
+                     {"Location/Agglomeration": 1, "_id": 0}, output=args.output, fmt=args.export,
+                     batch_size=args.export_batch_size, page_size=args.page_size)
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+benchmark-mongo.py
+
+A benchmark harness for the loaders and queries in access-mongo.py. It:
+- Generates synthetic CSV files shaped like the noise mapping data (10K, 1M, 10M or any
+  other number of rows)
+- Runs each loader mode (streaming, pipelined and incremental) against a throwaway
+  database on a local mongod, or against mongomock when no server is available
+- Times the prefix query, the prefix count and an NDJSON export of the matches
+- Records rows/s, p50/p95/p99/max latencies, peak memory (RSS) and the server's operation
+  counters into a JSON results file, which can be compared with a run from another commit
+
+Each case runs in a fresh process, so the peak memory of one case does not hide
+the next. Example:
+    python benchmark-mongo.py --sizes 10k,1m --output results-new.json --compare results-old.json
+
+Author: S.Hallett
+Course: MKU, Big Data and Visualisation
+Date: 18/06/2025
+"""
+
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timezone
+import argparse
+import csv
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+MODES = ("streaming", "pipelined", "incremental")
+
+# Column names and value ranges follow the noise mapping round 3 data
+COLUMNS = [
+    "Location/Agglomeration",
+    "Road_Pop_Lden>=55dB",
+    "Road_Pop_Lden>=70dB",
+    "Road_Pop_Lnight>=50dB",
+    "Railways_Pop_Lden>=55dB",
+    "Industry_Pop_Lden>=55dB",
+    "AgglomerationPopulation",
+]
+PLACE_NAMES = ["Manchester", "Milton Keynes", "Middlesbrough", "Leeds", "London", "Bristol",
+               "Birmingham", "Liverpool", "Luton", "Norwich", "Nottingham", "Sheffield"]
+
+
+def load_access_mongo():
+    """Load access-mongo.py (whose hyphenated name cannot be imported directly) as a module."""
+    spec = importlib.util.spec_from_file_location("access_mongo", os.path.join(HERE, "access-mongo.py"))
+    module = importlib.util.module_from_spec(spec)
+    # Register the module so that its functions can be pickled for the pipelined loader's workers
+    sys.modules["access_mongo"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_csv(path, rows, seed=1):
+    """
+    Write a synthetic noise mapping CSV file with the given number of rows.
+    About 5% of the numeric values are 'n/a', as in the real data.
+    Args:
+        path (str): Output file path
+        rows (int): Number of data rows
+        seed (int): Random seed, so that every run generates the same file
+    """
+    rng = random.Random(seed)
+
+    def count(high):
+        return "n/a" if rng.random() < 0.05 else str(rng.randint(0, high))
+
+    with open(path, "w", encoding="utf-8", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(COLUMNS)
+        for index in range(rows):
+            writer.writerow([f"{rng.choice(PLACE_NAMES)} {index}", count(500_000), count(50_000),
+                             count(300_000), count(100_000), count(10_000),
+                             str(rng.randint(10_000, 9_000_000))])
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def parse_size(size):
+    """
+    Return the number of rows for a size name such as '1m' or a plain row count such as '250000'.
+    Args:
+        size (str): A name from SIZES or a positive whole number
+    Returns:
+        int: Number of rows (None if the size is not valid)
+    """
+    if size in SIZES:
+        return SIZES[size]
+    return int(size) if size.isdigit() and int(size) > 0 else None
+
+
+def latency_summary(latencies):
+    """Summarise a list of latencies in seconds as p50/p95/p99/max milliseconds."""
+    return {
+        "count": len(latencies),
+        "p50_ms": None if not latencies else 1000 * percentile(latencies, 0.50),
+        "p95_ms": None if not latencies else 1000 * percentile(latencies, 0.95),
+        "p99_ms": None if not latencies else 1000 * percentile(latencies, 0.99),
+        "max_ms": None if not latencies else 1000 * max(latencies),
+    }
+
+
+def peak_rss_mb(children=False):
+    """
+    Return a peak resident memory figure in MB.
+    ru_maxrss is a peak, not a total: for the children it is the largest single
+    finished child, so the two figures are reported separately rather than added.
+    Args:
+        children (bool): Report the largest finished child process instead of this process
+    Returns:
+        float: Peak RSS in MB (None where the resource module is not available)
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def server_opcounters(db):
+    """Return the server's operation counters, or None if they are not available (mongomock)."""
+    try:
+        return dict(db.command("serverStatus")["opcounters"])
+    except Exception:
+        return None
+
+
+def run_case(options, result_queue):
+    """
+    Run one benchmark case (one loader mode on one file) and put its results on a queue.
+    This runs in a fresh process, started by run_case_in_process().
+    """
+    access_mongo = load_access_mongo()
+    verbose = options["verbose"]
+
+    if options["mongomock"]:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = access_mongo.get_client(options["uri"])
+    db = client[options["database"]]
+    collection = db[access_mongo.COLLECTION_NAME]
+    ops_before = server_opcounters(db)
+
+    workers, writers = options["workers"], options["writers"]
+    if options["mode"] == "pipelined" and multiprocessing.get_start_method() != "fork":
+        # Worker processes started with 'spawn' cannot import access_mongo by name,
+        # so convert in the reader thread and keep the concurrent writers
+        workers = 0
+
+    result = {"size": options["size"], "rows": options["rows"], "mode": options["mode"]}
+    with open(os.devnull, "w") as devnull, \
+            redirect_stdout(sys.stdout if verbose else devnull), \
+            redirect_stderr(sys.stderr if verbose else devnull):
+        start = time.perf_counter()
+        if options["mode"] == "streaming":
+            load = access_mongo.load_csv_to_mongodb(options["csv"], collection,
+                                                    batch_size=options["batch_size"])
+        elif options["mode"] == "pipelined":
+            load = access_mongo.load_csv_to_mongodb_pipelined(options["csv"], collection,
+                                                              workers=workers, writers=writers,
+                                                              batch_size=options["batch_size"])
+        else:
+            load = access_mongo.load_csv_to_mongodb_incremental(options["csv"], collection,
+                                                                batch_size=options["batch_size"])
+        load_seconds = time.perf_counter() - start
+
+        if options["mode"] == "incremental" and load is not None:
+            # Also time a refresh of the unchanged file, which should write nothing
+            refresh_start = time.perf_counter()
+            access_mongo.load_csv_to_mongodb_incremental(options["csv"], collection,
+                                                         batch_size=options["batch_size"])
+            result["unchanged_refresh_seconds"] = time.perf_counter() - refresh_start
+
+        if load is None:
+            result["error"] = "load failed (run with --verbose for details)"
+            result_queue.put(result)
+            return
+
+        result["load"] = {
+            "seconds": load_seconds,
+            "rows_per_second": options["rows"] / load_seconds if load_seconds > 0 else None,
+            "batch_latency": latency_summary(load["batch_latencies"]),
+        }
+
+        # Queries: the indexed prefix query with both counts, and the prefix count alone
+        query_filter = access_mongo.prefix_filter("Location/Agglomeration", "M")
+        projection = {"Location/Agglomeration": 1, "_id": 0}
+        query_latencies = []
+        count_latencies = []
+        for _ in range(options["query_repeats"]):
+            query_start = time.perf_counter()
+            access_mongo.query_with_counts(collection, query_filter, projection, page_size=100)
+            query_latencies.append(time.perf_counter() - query_start)
+
+            count_start = time.perf_counter()
+            collection.count_documents(query_filter)
+            count_latencies.append(time.perf_counter() - count_start)
+        result["prefix_query"] = latency_summary(query_latencies)
+        result["prefix_count"] = latency_summary(count_latencies)
+
+        try:
+            export_start = time.perf_counter()
+            exported = access_mongo.export_query(collection, query_filter, projection,
+                                                 output=os.devnull, fmt="ndjson")
+            export_seconds = time.perf_counter() - export_start
+            result["export_ndjson"] = {
+                "documents": exported["documents"],
+                "seconds": export_seconds,
+                "docs_per_second": exported["documents"] / export_seconds if export_seconds > 0 else None,
+            }
+        except NotImplementedError:
+            # mongomock does not implement find_raw_batches()
+            result["export_ndjson"] = None
+
+    ops_after = server_opcounters(db)
+    if ops_before is not None and ops_after is not None:
+        result["server_opcounters"] = {name: ops_after[name] - ops_before.get(name, 0) for name in ops_after}
+    result["peak_rss_mb"] = peak_rss_mb()
+    # Conversion workers of the pipelined loader are children of this process
+    result["peak_child_rss_mb"] = peak_rss_mb(children=True)
+
+    client.drop_database(options["database"])
+    result_queue.put(result)
+
+
+def run_case_in_process(options):
+    """Run run_case() in a fresh process and return its results."""
+    context = multiprocessing.get_context()
+    result_queue = context.Queue()
+    process = context.Process(target=run_case, args=(options, result_queue))
+    process.start()
+    # Read the result before joining, so a large result cannot block the child on a full pipe
+    try:
+        result = result_queue.get(timeout=options["timeout"])
+    except Exception:
+        result = {"size": options["size"], "rows": options["rows"], "mode": options["mode"],
+                  "error": "case failed or timed out (run with --verbose for details)"}
+        # Stop a case that is still running, so it does not go on loading into the database
+        if process.is_alive():
+            process.terminate()
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+    process.join(10)
+    return result
+
+
+def git_commit():
+    """Return the current git commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_comparison(results, baseline_path):
+    """Print the load throughput and query latency of each case next to a baseline results file."""
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(case["size"], case["mode"]): case for case in baseline.get("cases", [])}
+
+    print(f"\nComparison with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'case':<22}{'load rows/s':>24}{'prefix query p50 ms':>28}")
+    for case in results["cases"]:
+        old = previous.get((case["size"], case["mode"]))
+        if old is None or "load" not in case or "load" not in old:
+            continue
+        new_rate, old_rate = case["load"]["rows_per_second"], old["load"]["rows_per_second"]
+        new_p50, old_p50 = case["prefix_query"]["p50_ms"], old["prefix_query"]["p50_ms"]
+        print(f"{case['size'] + ' ' + case['mode']:<22}"
+              f"{old_rate:>11,.0f} -> {new_rate:>9,.0f}"
+              f"{old_p50:>14.2f} -> {new_p50:>9.2f}")
+
+
+def main():
+    """Generate the test files, run every case and write the results file."""
+    parser = argparse.ArgumentParser(description="Benchmark the access-mongo.py loaders and queries.")
+    parser.add_argument("--sizes", default="10k",
+                        help=f"Comma-separated file sizes to test, from {', '.join(SIZES)} "
+                             f"or a row count (default: 10k)")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"Comma-separated loader modes to test (default: {','.join(MODES)})")
+    parser.add_argument("--uri", default=None,
+                        help="MongoDB server to test against (default: MONGODB_URI or the local server)")
+    parser.add_argument("--mongomock", action="store_true",
+                        help="Use mongomock instead of a server (pip install mongomock); "
+                             "server op counters and exports are then not recorded")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "noise_benchmark"),
+                        help="Where to keep the generated CSV files (reused between runs)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="Conversion workers for pipelined mode")
+    parser.add_argument("--writers", type=int, default=4, help="Writer threads for pipelined mode")
+    parser.add_argument("--query-repeats", type=int, default=20,
+                        help="Number of times each query is timed")
+    parser.add_argument("--timeout", type=float, default=4 * 3600,
+                        help="Maximum seconds for a single case")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file to write")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Show the loaders' own progress output")
+    args = parser.parse_args()
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    modes = [mode.strip().lower() for mode in args.modes.split(",") if mode.strip()]
+    for size in sizes:
+        if parse_size(size) is None:
+            parser.error(f"unknown size '{size}' (choose from {', '.join(SIZES)} or give a row count)")
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode '{mode}' (choose from {', '.join(MODES)})")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": "mongomock" if args.mongomock else (args.uri or "MONGODB_URI/local"),
+        "settings": {"batch_size": args.batch_size, "workers": args.workers, "writers": args.writers,
+                     "query_repeats": args.query_repeats},
+        "cases": [],
+    }
+
+    for size in sizes:
+        csv_path = os.path.join(args.data_dir, f"noise_mapping_{size}.csv")
+        if not os.path.exists(csv_path):
+            print(f"Generating {csv_path} ({parse_size(size):,} rows)...")
+            generate_csv(csv_path + ".tmp", parse_size(size))
+            os.replace(csv_path + ".tmp", csv_path)
+
+        for mode in modes:
+            print(f"Running {size} {mode}...")
+            case = run_case_in_process({
+                "csv": csv_path, "size": size, "rows": parse_size(size), "mode": mode,
+                "uri": args.uri, "mongomock": args.mongomock,
+                # A throwaway database, dropped at the end of the case
+                "database": f"environmental_benchmark_{os.getpid()}",
+                "batch_size": args.batch_size, "workers": args.workers, "writers": args.writers,
+                "query_repeats": args.query_repeats, "timeout": args.timeout, "verbose": args.verbose,
+            })
+            results["cases"].append(case)
+            if "error" in case:
+                print(f"  {case['error']}")
+            else:
+                print(f"  load {case['load']['rows_per_second']:,.0f} rows/s, "
+                      f"prefix query p50 {case['prefix_query']['p50_ms']:.2f} ms / "
+                      f"p95 {case['prefix_query']['p95_ms']:.2f} ms / "
+                      f"p99 {case['prefix_query']['p99_ms']:.2f} ms, "
+                      f"peak RSS {case['peak_rss_mb'] or 0:.0f} MB")
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()